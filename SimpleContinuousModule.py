@@ -30,4 +30,12 @@ class SimpleCanvas(mesa.visualization.VisualizationElement):
             portrayal["x"] = x
             portrayal["y"] = y
             space_state.append(portrayal)
+        # food is not in the schedule, draw the remaining items of the layer
+        for x, y in model.food_layer.alive_positions():
+            portrayal = self.portrayal_method(model.food_layer)
+            x = (x - model.grid.x_min) / (model.grid.x_max - model.grid.x_min)
+            y = (y - model.grid.y_min) / (model.grid.y_max - model.grid.y_min)
+            portrayal["x"] = x
+            portrayal["y"] = y
+            space_state.append(portrayal)
         return space_state
\ No newline at end of file
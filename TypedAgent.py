@@ -1,5 +1,4 @@
 import mesa
-from copy import deepcopy
 
 class TypedAgent(mesa.Agent):
 	"""An agent that is a predator"""
@@ -7,13 +6,22 @@ class TypedAgent(mesa.Agent):
 	params = []
 	age = 0
 	energy = 0
+	# AgentStore holding this agent's columns, if its type has one
+	_store = None
+	_idx = None
 	def __init__(self, unique_id, model, params = None):
 		super().__init__(unique_id, model)
 		if params is not None:
-			self.params = deepcopy(params)
+			# the values are never changed in place (mutate_params works on
+			# its own deepcopy), so a shallow copy keeps agents independent
+			self.params = dict(params)
 		else:
 			self.params = None
 
+	def attach(self, store):
+		self._store = store
+		self._idx = store.add(self)
+
 	def set_position(self, pos):
 		self.position = pos
 
@@ -24,10 +32,25 @@ class TypedAgent(mesa.Agent):
 		return self.params
 
 	def die(self):
+		# during a step the dead are removed together once it is over
+		if self.model.stepping:
+			self.model.pending_deaths[self] = None
+			return
 		self.model.schedule.remove(self)
+		self.model.data_collector.record_death(self)
+		# dead agents should not show up in neighbour queries anymore
+		if self.pos is not None:
+			self.model.remove_agent(self)
+		if self._store is not None:
+			self._store.detach(self)
 
 	def step(self):
 		self.age += 1
+
+	def catch_up(self, steps):
+		# called by WheelActivation before the first step after sleeping
+		# through ``steps`` steps, to apply what those steps would have done
+		self.age += steps
 	
 	def get_energy(self):
 		return self.energy
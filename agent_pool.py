@@ -0,0 +1,35 @@
+class AgentPool:
+    """Dead agents of one class, kept to be reset and reused for births.
+
+    release() takes an agent that has been removed from the model (the
+    schedule, the space and its AgentStore), acquire() hands one back or
+    None when the pool is empty. At most max_size dead agents are kept.
+    """
+
+    def __init__(self, max_size=4096):
+        self.max_size = max_size
+        self.free = []
+        self.created = 0
+        self.reused = 0
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self.free)
+
+    def acquire(self):
+        if not self.free:
+            self.created += 1
+            return None
+        self.reused += 1
+        return self.free.pop()
+
+    def release(self, agent):
+        if len(self.free) < self.max_size:
+            self.free.append(agent)
+        else:
+            self.dropped += 1
+
+    def stats(self):
+        births = self.created + self.reused
+        return {"free": len(self.free), "created": self.created, "reused": self.reused,
+                "dropped": self.dropped, "reuse_rate": self.reused / births if births else 0.0}
@@ -0,0 +1,174 @@
+import numpy as np
+
+
+def as_scalar(value):
+    # evolvable params are often 1-element arrays
+    if isinstance(value, (float, int)):
+        return float(value)
+    return float(np.asarray(value, dtype=float).reshape(-1)[0])
+
+
+class AgentStore:
+    """Columnar state of all living agents of one type.
+
+    Agents are thin handles holding their row (``agent._idx``) into the
+    contiguous columns below. Removing an agent moves the last row into the
+    freed slot, so the first ``n`` rows are always the living population and
+    whole-population work can be done with plain NumPy on ``view(column)``.
+    """
+
+    COLUMNS = ("position", "heading", "energy", "age", "state", "genome")
+    # set by ReadBuffer.freeze during a synchronous step
+    frozen = None
+    buffer = None
+
+    def __init__(self, genome, capacity=64):
+        self.genome_names = list(genome)
+        self.genome_index = {name: i for i, name in enumerate(self.genome_names)}
+        self.n = 0
+        self.agents = []
+        capacity = max(capacity, 1)
+        self.position = np.zeros((capacity, 2))
+        self.heading = np.zeros((capacity, 2))
+        self.energy = np.zeros(capacity)
+        self.age = np.zeros(capacity)
+        self.state = np.zeros(capacity, dtype=np.int64)
+        self.genome = np.zeros((capacity, len(self.genome_names)))
+
+    def __len__(self):
+        return self.n
+
+    def capacity(self):
+        return len(self.energy)
+
+    def _grow(self):
+        # amortized O(1) births: double the capacity when full
+        new_capacity = 2 * self.capacity()
+        for name in self.COLUMNS:
+            column = getattr(self, name)
+            grown = np.zeros((new_capacity,) + column.shape[1:], dtype=column.dtype)
+            grown[:self.n] = column[:self.n]
+            setattr(self, name, grown)
+
+    def add(self, agent):
+        if self.n == self.capacity():
+            self._grow()
+        idx = self.n
+        for name in self.COLUMNS:
+            getattr(self, name)[idx] = 0
+        self.agents.append(agent)
+        self.n += 1
+        return idx
+
+    def remove(self, idx):
+        # compaction: the last row takes the place of the removed one
+        last = self.n - 1
+        if idx != last:
+            for name in self.COLUMNS:
+                column = getattr(self, name)
+                column[idx] = column[last]
+            moved = self.agents[last]
+            self.agents[idx] = moved
+            moved._idx = idx
+        self.agents.pop()
+        self.n -= 1
+
+    def detach(self, agent):
+        """Take agent out of the store, it keeps its last values in a private one-row store."""
+        own = AgentStore(self.genome_names, capacity=1)
+        own.add(agent)
+        for name in self.COLUMNS:
+            getattr(own, name)[0] = getattr(self, name)[agent._idx]
+        self.remove(agent._idx)
+        agent._store, agent._idx = own, 0
+
+    def view(self, column):
+        return getattr(self, column)[:self.n]
+
+    def genome_column(self, name):
+        return self.genome[:self.n, self.genome_index[name]]
+
+    def frozen_value(self, column, idx):
+        # agents born during the step have no frozen row yet
+        frozen = self.frozen[column]
+        if idx < len(frozen):
+            return frozen[idx]
+        return getattr(self, column)[idx]
+
+
+class ReadBuffer:
+    """What the agents see of each other during a synchronous step.
+
+    freeze() copies the columns other agents read (position, heading,
+    state, energy) of the given stores. Until thaw(), an agent reading
+    another agent's columns gets the frozen values from the start of the
+    step, while its own columns (actor is the agent being stepped) are
+    read and written live. Rows are not compacted in between, the model
+    defers deaths to the end of a synchronous step.
+    """
+
+    COLUMNS = ("position", "heading", "state", "energy")
+
+    def __init__(self, stores):
+        self.stores = stores
+        self.actor = None
+
+    def freeze(self):
+        for store in self.stores:
+            store.frozen = {column: store.view(column).copy() for column in self.COLUMNS}
+            store.buffer = self
+
+    def thaw(self):
+        for store in self.stores:
+            store.frozen = None
+        self.actor = None
+
+
+def column_property(column):
+    """Scalar column of the agent's store (energy, age)."""
+    def fget(agent):
+        store = agent._store
+        if store.frozen is not None and column in store.frozen and agent is not store.buffer.actor:
+            return store.frozen_value(column, agent._idx)
+        return getattr(store, column)[agent._idx]
+
+    def fset(agent, value):
+        getattr(agent._store, column)[agent._idx] = as_scalar(value)
+    return property(fget, fset)
+
+
+def vector_property(column):
+    """2D column of the agent's store (position, heading), read as a copy."""
+    def fget(agent):
+        store = agent._store
+        if store.frozen is not None and agent is not store.buffer.actor:
+            return store.frozen_value(column, agent._idx).copy()
+        return getattr(store, column)[agent._idx].copy()
+
+    def fset(agent, value):
+        getattr(agent._store, column)[agent._idx] = (as_scalar(value[0]), as_scalar(value[1]))
+    return property(fget, fset)
+
+
+def state_property(states):
+    """State enum stored as its integer value."""
+    def fget(agent):
+        store = agent._store
+        if store.frozen is not None and agent is not store.buffer.actor:
+            return states(int(store.frozen_value("state", agent._idx)))
+        return states(int(store.state[agent._idx]))
+
+    def fset(agent, value):
+        agent._store.state[agent._idx] = value.value
+    return property(fget, fset)
+
+
+def genome_property(name):
+    def fget(agent):
+        store = agent._store
+        return store.genome[agent._idx, store.genome_index[name]]
+
+    def fset(agent, value):
+        store = agent._store
+        store.genome[agent._idx, store.genome_index[name]] = as_scalar(value)
+    return property(fget, fset)
@@ -1,8 +1,14 @@
 from model_params import *
 import pandas as pd
 from model import Model
+from chunk_store import ChunkWriter
+from run_cache import params_digest
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import os
 import time
+import traceback
 import numpy as np
+from scipy import stats
 
 batch_params = [model_params_no_evolve_5,
                 model_params_no_evolve_7, 
@@ -10,70 +16,280 @@ batch_params = [model_params_no_evolve_5,
 				model_params_evolve_5,
                 model_params_evolve_7, 
 				model_params_evolve_9]
+
+
+def run_job(params, n_time_steps, seed, results_dir = None, checkpoint_path = None, checkpoint_every = None):
+	# one (setup, replicate) run, module level so worker processes can pickle it.
+	# with a checkpoint_path the run is saved every checkpoint_every steps and
+	# picks up from the last checkpoint if one is there (e.g. after a crash)
+	t_start = time.time()
+	if checkpoint_path is not None and os.path.exists(checkpoint_path):
+		model = Model.load_checkpoint(checkpoint_path)
+	else:
+		model = Model(**params, seed=seed, results_dir=results_dir)
+	while model.step_nr < n_time_steps:
+		model.step()
+		if checkpoint_path is not None and model.step_nr % checkpoint_every == 0 and model.step_nr < n_time_steps:
+			model.save_checkpoint(checkpoint_path)
+	model.data_collector.close()
+	if checkpoint_path is not None and os.path.exists(checkpoint_path):
+		os.remove(checkpoint_path)
+	return model.get_global_overview(), time.time() - t_start
+
+
+def run_job_reported(*args):
+	# run_job that hands failures back as (None, wall time, traceback) instead
+	# of raising, so a failed job is timed the same in a worker and in serial
+	t_start = time.time()
+	try:
+		df, wall_time = run_job(*args)
+	except Exception:
+		return None, time.time() - t_start, traceback.format_exc()
+	return df, wall_time, None
+
+
+def summary_frame(columns, n, mean, var, confidence):
+	# per step mean, sample variance and the t confidence interval of the mean
+	if n > 1:
+		half_width = stats.t.ppf((1 + confidence) / 2, n - 1) * np.sqrt(var / n)
+	else:
+		half_width = np.full(mean.shape, np.nan)
+	data = {}
+	for i, name in enumerate(columns):
+		data[name] = mean[:, i]
+		data[name + "_var"] = var[:, i]
+		data[name + "_ci_low"] = mean[:, i] - half_width[:, i]
+		data[name + "_ci_high"] = mean[:, i] + half_width[:, i]
+	return pd.DataFrame(data)
+
+
+def summarize(dfs, confidence = 0.95):
+	""" Mean, variance and confidence interval per step over replicate DataFrames
+
+	The replicates are stacked into one (replicates, steps, columns) array,
+	cut to the shortest replicate.
+	"""
+	columns = list(dfs[0].columns)
+	n_steps = min(len(df) for df in dfs)
+	values = np.stack([df[columns].to_numpy(dtype=float)[:n_steps] for df in dfs])
+	if len(dfs) > 1:
+		var = values.var(axis=0, ddof=1)
+	else:
+		var = np.full(values.shape[1:], np.nan)
+	return summary_frame(columns, len(dfs), values.mean(axis=0), var, confidence)
+
+
+class ReplicateStats:
+	""" Streaming (Welford) version of summarize
+
+	Replicates are folded in one at a time with add(), so they do not have
+	to be kept around until the last one finishes.
+	"""
+
+	def __init__(self):
+		self.n = 0
+		self.columns = None
+		self.mean = None
+		self.m2 = None
+
+	def add(self, df):
+		if self.columns is None:
+			self.columns = list(df.columns)
+		values = df[self.columns].to_numpy(dtype=float)
+		if self.mean is None:
+			self.n = 1
+			self.mean = values.copy()
+			self.m2 = np.zeros(values.shape)
+			return
+		n_steps = min(len(self.mean), len(values))
+		self.mean, self.m2, values = self.mean[:n_steps], self.m2[:n_steps], values[:n_steps]
+		self.n += 1
+		delta = values - self.mean
+		self.mean += delta / self.n
+		self.m2 += delta * (values - self.mean)
+
+	def summary(self, confidence = 0.95):
+		if self.n > 1:
+			var = self.m2 / (self.n - 1)
+		else:
+			var = np.full(self.mean.shape, np.nan)
+		return summary_frame(self.columns, self.n, self.mean, var, confidence)
+
+
 class BatchRun:
-	def __init__(self, n_timesteps, runs_per_setup = 3, batch_params=batch_params) -> None:
+	def __init__(self, n_timesteps, runs_per_setup = 3, batch_params=batch_params,
+			n_workers = 1, base_seed = None, cache = None, stream_dir = None, results_format = "csv",
+			streaming_stats = False, confidence = 0.95, checkpoint_dir = None, checkpoint_every = 100) -> None:
 		self.time_step = 0
 		self.n_time_steps = n_timesteps
 		self.batch_params = batch_params
 		self.runs_per_setup = runs_per_setup
 		self.batch_results = []
-		
+		# per setup: mean, variance and confidence interval of every column
+		self.batch_stats = []
+		# fold replicates into ReplicateStats as they finish instead of keeping them
+		self.streaming_stats = streaming_stats
+		self.confidence = confidence
+		# n_workers > 1 runs the jobs in a process pool
+		self.n_workers = n_workers
+		# replicate r of a setup gets the seed spawned from (base_seed, digest
+		# of the setup's params, r): every job has its own stream, and adding
+		# or reordering setups or replicates keeps the seeds of the others
+		if base_seed is None:
+			base_seed = np.random.SeedSequence().entropy
+		self.base_seed = base_seed
+		# optional run_cache.RunCache, replicates found in it are not rerun
+		self.cache = cache
+		# with stream_dir every replicate streams its data to its own
+		# directory in there while it runs (see DataCollector.stream_to)
+		self.stream_dir = stream_dir
+		# "csv" or "chunks" (a chunk_store directory per setup)
+		self.results_format = results_format
+		# per job: batch, run, seed, wall time and error (None if it succeeded)
+		self.job_reports = []
+		# with checkpoint_dir every replicate saves its model there every
+		# checkpoint_every steps, a rerun of the sweep resumes from those
+		self.checkpoint_dir = checkpoint_dir
+		self.checkpoint_every = checkpoint_every
+		if checkpoint_dir is not None:
+			os.makedirs(checkpoint_dir, exist_ok=True)
+
+	def job_dir(self, batch_idx, run):
+		if self.stream_dir is None:
+			return None
+		return os.path.join(self.stream_dir, "batch{0}_run{1}".format(batch_idx, run))
+
+	def job_checkpoint(self, batch_idx, run, seed):
+		if self.checkpoint_dir is None:
+			return None
+		# named after the params (not n_time_steps, a longer rerun may resume),
+		# an edited setup never picks up a checkpoint of the old one
+		digest = params_digest(self.batch_params[batch_idx])[:16]
+		return os.path.join(self.checkpoint_dir, "batch{0}_run{1}_{2}_{3}.ckpt.gz".format(batch_idx, run, digest, seed))
+
+	def job_args(self, batch_idx, run, seed):
+		return (self.batch_params[batch_idx], self.n_time_steps, seed, self.job_dir(batch_idx, run),
+				self.job_checkpoint(batch_idx, run, seed), self.checkpoint_every)
+
+	def job_seed(self, params, run):
+		setup = int(params_digest(params)[:16], 16)
+		return int(np.random.SeedSequence([self.base_seed, setup, run]).generate_state(1, np.uint64)[0])
+
+	def job_seeds(self):
+		return {(batch_idx, run): self.job_seed(self.batch_params[batch_idx], run)
+				for batch_idx in range(len(self.batch_params))
+				for run in range(self.runs_per_setup)}
 
 	def run(self, save = True):
+		seeds = self.job_seeds()
+		results = {}
+		running_stats = {}
+
+		def collect(batch_idx, run, df):
+			if self.streaming_stats:
+				running_stats.setdefault(batch_idx, ReplicateStats()).add(df)
+			else:
+				results[(batch_idx, run)] = df
+
+		if self.cache is not None:
+			for (batch_idx, run), seed in list(seeds.items()):
+				df = self.cache.get(self.batch_params[batch_idx], self.n_time_steps, seed)
+				if df is not None:
+					print("batch " + str(batch_idx) + " run " + str(run) + " loaded from cache")
+					collect(batch_idx, run, df)
+					del seeds[(batch_idx, run)]
+
+		def finished(batch_idx, run, df):
+			if self.cache is not None:
+				self.cache.put(self.batch_params[batch_idx], self.n_time_steps, seeds[(batch_idx, run)], df)
+			collect(batch_idx, run, df)
+
+		if self.n_workers > 1:
+			self.run_parallel(seeds, finished)
+		else:
+			self.run_serial(seeds, finished)
+
 		for batch_idx in range(len(self.batch_params)):
-			print("Batch " + str(batch_idx))
-			t_start = time.time()
-			N, width, height, attack_distance, evolve = self.batch_params[batch_idx].values()
-			data_this_setup = []
-			for run in range(self.runs_per_setup):
-				print("run " + str(run))
-				model = Model(N, width, height, 
-									attack_distance, evolve)
-				for t_step in range(self.n_time_steps):
-					model.step()
-				
-				data_this_setup.append(model.get_global_overview())
-			df = self.average_entries(data_this_setup)
+			summary = None
+			if self.streaming_stats and batch_idx in running_stats:
+				columns = running_stats[batch_idx].columns
+				summary = running_stats[batch_idx].summary(self.confidence)
+			elif not self.streaming_stats:
+				# replicates in run order, failed ones left out
+				data_this_setup = [results[(batch_idx, run)] for run in range(self.runs_per_setup)
+									if (batch_idx, run) in results]
+				if data_this_setup:
+					columns = list(data_this_setup[0].columns)
+					summary = summarize(data_this_setup, self.confidence)
+			if summary is None:
+				print("batch " + str(batch_idx) + " has no successful runs")
+				self.batch_results.append(None)
+				self.batch_stats.append(None)
+				continue
+			# the plain means keep the columns of the global overview
+			df = summary[columns]
 			print(df.shape)
-			
+
 			self.batch_results.append(df)
+			self.batch_stats.append(summary)
 			if save:
-				df.to_csv("./results/batch{0}_{1}.csv".format(batch_idx, self.n_time_steps))
-				
-			print("batch " + str(batch_idx) + " completed in: " + str(time.time() - t_start) + " s")
+				self.save(df, "./results/batch{0}_{1}".format(batch_idx, self.n_time_steps))
+				self.save(summary, "./results/batch{0}_{1}_stats".format(batch_idx, self.n_time_steps))
 
+	def save(self, df, path):
+		if self.results_format == "chunks":
+			writer = ChunkWriter(path)
+			writer.append_block("global_overview", {name: df[name].to_numpy() for name in df.columns})
+			writer.close()
+		else:
+			df.to_csv(path + ".csv")
 
+	def report(self, batch_idx, run, seed, wall_time, error=None):
+		self.job_reports.append({"batch": batch_idx, "run": run, "seed": seed,
+								"time": wall_time, "error": error})
+		if error is None:
+			print("batch " + str(batch_idx) + " run " + str(run) + " completed in: " + str(wall_time) + " s")
+		else:
+			print("batch " + str(batch_idx) + " run " + str(run) + " failed:\n" + error)
+
+	def run_serial(self, seeds, finished):
+		# finished(batch_idx, run, df) is called with every successful replicate
+		for batch_idx in range(len(self.batch_params)):
+			print("Batch " + str(batch_idx))
+			for run in range(self.runs_per_setup):
+				if (batch_idx, run) not in seeds:
+					continue
+				print("run " + str(run))
+				seed = seeds[(batch_idx, run)]
+				df, wall_time, error = run_job_reported(*self.job_args(batch_idx, run, seed))
+				self.report(batch_idx, run, seed, wall_time, error)
+				if error is None:
+					finished(batch_idx, run, df)
+
+	def run_parallel(self, seeds, finished):
+		with ProcessPoolExecutor(max_workers=self.n_workers) as pool:
+			futures = {pool.submit(run_job_reported, *self.job_args(batch_idx, run, seed)): (batch_idx, run, seed, time.time())
+						for (batch_idx, run), seed in seeds.items()}
+			for future in as_completed(futures):
+				batch_idx, run, seed, submitted = futures[future]
+				error = future.exception()
+				if error is not None:
+					# the job never reported back (e.g. the worker process died),
+					# the time since submission is all there is
+					message = "".join(traceback.format_exception(type(error), error, error.__traceback__))
+					self.report(batch_idx, run, seed, time.time() - submitted, message)
+					continue
+				df, wall_time, error = future.result()
+				self.report(batch_idx, run, seed, wall_time, error)
+				if error is None:
+					finished(batch_idx, run, df)
 
 	def average_entries(self, dfs):
-		final_df = pd.DataFrame(columns = dfs[0].columns)
-		
-		for row in range(dfs[0].shape[0]):
-			predation_risk = 0.0
-			vigilance_total = 0.0
-			vigilance_avg = 0.0
-			time = 0
-			group_size_prey = 0.0
-			for df in dfs:
-				predation_risk += df["predation_risk"].to_numpy()[row] # might be stupid to average out
-				vigilance_total += df["vigilance_total"].to_numpy()[row]
-				vigilance_avg += df["vigilance_avg"].to_numpy()[row]
-				time += df["time"].to_numpy()[row] # kind of stupid I know
-				group_size_prey += df["group_size_prey"].to_numpy()[row]
-			predation_risk /= len(dfs)
-			vigilance_total /= len(dfs)
-			vigilance_avg /= len(dfs)
-			time /= len(dfs)
-			group_size_prey /= len(dfs)
-			data = {	"predation_risk" : predation_risk,
-					"vigilance_total" : vigilance_total,
-					"vigilance_avg" : vigilance_avg, 
-					"time"			: time,
-					"group_size_prey" : group_size_prey
-				}
-			row_add = pd.DataFrame(data, index=[0])
-			final_df = pd.concat([final_df, row_add])
-		return final_df
-
-
-br = BatchRun(n_timesteps=2000, runs_per_setup = 3, batch_params=batch_params)
-br.run(save=True)
\ No newline at end of file
+		# per step mean over the replicates, see summarize for the rest
+		summary = summarize(dfs)
+		return summary[list(dfs[0].columns)]
+
+
+if __name__ == "__main__":
+	br = BatchRun(n_timesteps=2000, runs_per_setup = 3, batch_params=batch_params)
+	br.run(save=True)
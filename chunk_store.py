@@ -0,0 +1,120 @@
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+
+class ChunkWriter:
+    """Streams tables of columns to disk in fixed-size chunks.
+
+    Rows are buffered per table and every ``chunk_size`` rows each column is
+    written as its own .npy file, ``<directory>/<table>/<column>/<n>.npy``,
+    so memory stays bounded however long a run gets. close() writes the
+    last partial chunk. ChunkReader reads the result back. Writing into a
+    directory replaces the tables an earlier run left there.
+    """
+
+    def __init__(self, directory, chunk_size=4096):
+        self.directory = directory
+        self.chunk_size = chunk_size
+        # table -> {column: [arrays]}, the rows not written yet
+        self.buffers = {}
+        self.buffered = {}
+        self.chunks = {}
+        self.columns = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def append(self, table, row):
+        """Add one row, a dict of scalars."""
+        self.append_block(table, {name: np.asarray([value]) for name, value in row.items()})
+
+    def append_block(self, table, block):
+        """Add many rows at once, a dict of equally long arrays."""
+        if table not in self.buffers:
+            self.columns[table] = list(block)
+            self.buffers[table] = {name: [] for name in block}
+            self.buffered[table] = 0
+            self.chunks[table] = 0
+            # chunks of an earlier run must not be read as part of this one
+            shutil.rmtree(os.path.join(self.directory, table), ignore_errors=True)
+            self.write_meta()
+        n = 0
+        for name in self.columns[table]:
+            values = np.asarray(block[name])
+            self.buffers[table][name].append(values)
+            n = len(values)
+        self.buffered[table] += n
+        while self.buffered[table] >= self.chunk_size:
+            self.flush(table, self.chunk_size)
+
+    def flush(self, table, n=None):
+        """Write the first n buffered rows of a table (all of them by default)."""
+        if n is None:
+            n = self.buffered[table]
+        if n == 0:
+            return
+        chunk = self.chunks[table]
+        for name in self.columns[table]:
+            values = np.concatenate(self.buffers[table][name])
+            path = os.path.join(self.directory, table, name)
+            os.makedirs(path, exist_ok=True)
+            np.save(os.path.join(path, "%06d.npy" % chunk), values[:n])
+            self.buffers[table][name] = [values[n:]]
+        self.buffered[table] -= n
+        self.chunks[table] += 1
+        self.write_meta()
+
+    def write_meta(self):
+        with open(os.path.join(self.directory, "meta.json"), "w") as f:
+            json.dump({"chunk_size": self.chunk_size, "columns": self.columns, "chunks": self.chunks}, f)
+
+    def close(self):
+        for table in self.buffers:
+            self.flush(table)
+
+
+class ChunkReader:
+    """Reads what a ChunkWriter wrote, one column at a time.
+
+    The chunks are opened memory mapped, so only the parts of a column that
+    are actually used get loaded.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, "meta.json")) as f:
+            meta = json.load(f)
+        self.chunk_size = meta["chunk_size"]
+        self.columns = meta["columns"]
+        self.n_chunks = meta.get("chunks")
+
+    def tables(self):
+        return list(self.columns)
+
+    def chunks(self, table, column):
+        """Memory-mapped chunks of one column, in order."""
+        # only the chunks meta.json lists, whatever else is in the directory
+        path = os.path.join(self.directory, table, column)
+        if self.n_chunks is None:
+            # written before meta.json counted the chunks
+            if not os.path.isdir(path):
+                return []
+            names = sorted(name for name in os.listdir(path) if name.endswith(".npy"))
+        else:
+            names = ["%06d.npy" % chunk for chunk in range(self.n_chunks.get(table, 0))]
+        return [np.load(os.path.join(path, name), mmap_mode="r") for name in names]
+
+    def column(self, table, column):
+        chunks = self.chunks(table, column)
+        if not chunks:
+            return np.zeros(0)
+        if len(chunks) == 1:
+            return chunks[0]
+        return np.concatenate(chunks)
+
+    def to_dataframe(self, table, columns=None):
+        if columns is None:
+            columns = self.columns[table]
+        return pd.DataFrame({name: self.column(table, name) for name in columns})
@@ -1,15 +1,131 @@
 from mesa.datacollection import DataCollector as DC
+import numpy as np
 import pandas as pd
+from chunk_store import ChunkWriter, ChunkReader
+from agent_store import as_scalar
+import predator_params
 
 
+# named functions rather than lambdas so a model (and its collector) can be pickled
+def count_agents(m):
+	return m.schedule.get_agent_count()
+
+def count_prey(m):
+	return m.schedule.get_type_count("prey")
+
+def count_food(m):
+	return m.schedule.get_type_count("food")
+
+def count_predators(m):
+	return m.schedule.get_type_count("predator")
+
 model_reporters = {
-	"n_agents"		: 	lambda m: m.schedule.get_agent_count()	,
-	"n_prey"		: 	lambda m: m.n_agents_per_type["prey"]	,
-	"n_food"		: 	lambda m: m.n_agents_per_type["food"]	,
-	"n_predator"	: 	lambda m: m.n_agents_per_type["predator"]	
+	"n_agents"		: 	count_agents	,
+	"n_prey"		: 	count_prey	,
+	"n_food"		: 	count_food	,
+	"n_predator"	: 	count_predators	
 }
 agent_reporters = None
 
+global_overview_columns = ["predation_risk", "vigilance_total", "vigilance_avg", "time", "group_size_prey"]
+
+
+class ColumnRecorder:
+	""" Append-only table kept as one preallocated NumPy array per column
+
+	The arrays double in length when full, so recording a row is O(1)
+	amortized however long the run is. A DataFrame is only built on request.
+	The dtype of each column is taken from the first row recorded, tuples
+	go into object columns.
+	"""
+
+	def __init__(self, columns, capacity = 1024):
+		self.columns = list(columns)
+		self.capacity = capacity
+		self.n = 0
+		self.data = None
+
+	def __len__(self):
+		return self.n
+
+	def append(self, row):
+		if self.data is None:
+			self.data = {name: np.zeros(self.capacity, dtype=object if isinstance(row[name], tuple)
+										else np.asarray(row[name]).dtype)
+						for name in self.columns}
+		if self.n == self.capacity:
+			self.capacity *= 2
+			for name in self.columns:
+				grown = np.zeros(self.capacity, dtype=self.data[name].dtype)
+				grown[:self.n] = self.data[name][:self.n]
+				self.data[name] = grown
+		for name in self.columns:
+			self.data[name][self.n] = row[name]
+		self.n += 1
+
+	def column(self, name):
+		return self.data[name][:self.n]
+
+	def to_dataframe(self):
+		if self.data is None:
+			return pd.DataFrame(columns=self.columns)
+		return pd.DataFrame({name: self.column(name).copy() for name in self.columns})
+
+
+def genome_value(value):
+	# parameters are scalars or 1-element arrays, the predators' position a tuple
+	if np.size(value) == 1:
+		return as_scalar(value)
+	return tuple(value)
+
+
+class GenomeTable:
+	""" Genome of every agent of one type that was ever born
+
+	Rows are appended once, at birth, with the parent's id (-1 for the
+	initial population) and the birth step. The death step (-1 while alive)
+	is filled in later through the unique_id -> row index. The genome is
+	the agent's parameter dict as given at birth (unscaled), see
+	DataCollector.genome_params.
+	"""
+
+	def __init__(self, genome_names):
+		self.genome_names = list(genome_names)
+		self.table = ColumnRecorder(["unique_id", "parent_id", "birth_step", "death_step"] + self.genome_names)
+		self.row_of = {}
+
+	def __len__(self):
+		return len(self.table)
+
+	def record_birth(self, agent, parent, step, params):
+		if agent.unique_id in self.row_of:
+			return
+		row = {"unique_id": agent.unique_id,
+				"parent_id": -1 if parent is None else parent.unique_id,
+				"birth_step": step,
+				"death_step": -1}
+		row.update((name, genome_value(params[name])) for name in self.genome_names)
+		self.row_of[agent.unique_id] = len(self.table)
+		self.table.append(row)
+
+	def record_death(self, agent, step):
+		row = self.row_of.get(agent.unique_id)
+		if row is not None:
+			self.table.data["death_step"][row] = step
+
+	def to_dataframe(self):
+		return self.table.to_dataframe().set_index("unique_id")
+
+	def to_parquet(self, path):
+		# needs pyarrow or fastparquet, like any DataFrame.to_parquet
+		self.to_dataframe().to_parquet(path)
+
+	def to_npz(self, path):
+		if len(self.table) == 0:
+			np.savez(path)
+			return
+		np.savez(path, **{name: self.table.column(name) for name in self.table.columns})
+
 
 class DataCollector(DC):
 	
@@ -19,24 +135,51 @@ class DataCollector(DC):
 			agent_reporters = agent_reporters)
 		self.evolvable_params_prey = pd.DataFrame()
 		self.evolvable_params_predator = pd.DataFrame()
-		self.global_overview = pd.DataFrame(columns=["predation_risk", "vigilance_total", "vigilance_avg", "time", "group_size_prey"])
-		#  Initial dataf
-		self.evolvable_params_prey.insert(loc = 0, column="id", value=-1)
-		self.evolvable_params_predator.insert(loc = 0, column="id", value=-1)
+		# one row per step, see get_global_overview and get_model_vars_dataframe
+		self.global_overview = ColumnRecorder(global_overview_columns)
+		self.model_recorder = ColumnRecorder(self.model_reporters.keys())
+		# genomes logged at birth, see record_birth/record_death
+		self.genomes = {"prey": GenomeTable(model.evolvable_params_prey),
+						"predator": GenomeTable(predator_params.default_params_predator)}
+		# set by stream_to, rows then go to disk instead of the recorders
+		self.sink = None
+		self.record_agents = False
 		self.model = model
 
+	def stream_to(self, directory, chunk_size = 4096, record_agents = False):
+		""" Write the collected data to directory in chunks during the run
+
+		With record_agents the state of every living prey and predator is
+		written each step as well (tables agents_prey and agents_predator).
+		Call close() at the end of the run to write the last partial chunks.
+		"""
+		self.sink = ChunkWriter(directory, chunk_size)
+		self.record_agents = record_agents
+
+	def close(self):
+		if self.sink is not None:
+			self.sink.close()
+
 	def collect(self, model):
-		super().collect(model)
+		# model reporters go into the recorder instead of mesa's lists
+		model_vars = {var: reporter(model) for var, reporter in self.model_reporters.items()}
+		if self.sink is not None:
+			self.sink.append("model_vars", model_vars)
+		else:
+			self.model_recorder.append(model_vars)
+		if self.record_agents:
+			self.record_agent_columns(model)
+		if self.agent_reporters:
+			agent_records = self._record_agents(model)
+			self._agent_records[model.schedule.steps] = list(agent_records)
 		self.record_global_overview(model)
 
 	def record_global_overview(self, model):
-		vigilance = 0
-		prey_agents = model.get_prey()
-		for prey in prey_agents:
-			vigilance += prey.pv
+		# the pv of every living prey is a column of the prey store
+		vigilance = float(model.prey_store.genome_column("pv").sum())
 		predation = model.attack_distance
 		time = model.step_nr
-		group_sz_prey = len(prey_agents)
+		group_sz_prey = model.schedule.get_type_count("prey")
 		vigilance_avg = vigilance / max(group_sz_prey, 1)
 		data = {	"predation_risk" : predation,
 					"vigilance_total" : vigilance,
@@ -44,37 +187,56 @@ class DataCollector(DC):
 					"time"			: time,
 					"group_size_prey" : group_sz_prey
 				}
-		row = pd.DataFrame(data, index=[0])
-		
-		self.global_overview = pd.concat([self.global_overview, row])
-		
+		if self.sink is not None:
+			self.sink.append("global_overview", data)
+		else:
+			self.global_overview.append(data)
+
+	def record_agent_columns(self, model):
+		# one block of rows per type, straight from the store columns
+		for type, store in (("prey", model.prey_store), ("predator", model.predator_store)):
+			position = store.view("position")
+			self.sink.append_block("agents_" + type, {
+				"step": np.full(store.n, model.step_nr),
+				"unique_id": np.array([agent.unique_id for agent in store.agents], dtype=np.int64),
+				"x": position[:, 0].copy(),
+				"y": position[:, 1].copy(),
+				"energy": store.view("energy").copy(),
+				"age": store.view("age").copy(),
+				"state": store.view("state").copy()
+			})
+
+	def read_table(self, table):
+		if table not in self.sink.columns:
+			return pd.DataFrame()
+		# everything collected so far has to be on disk first
+		self.sink.flush(table)
+		return ChunkReader(self.sink.directory).to_dataframe(table)
 
 	def get_global_overview(self):
-		return self.global_overview
+		if self.sink is not None:
+			return self.read_table("global_overview")
+		return self.global_overview.to_dataframe()
+
+	def get_model_vars_dataframe(self):
+		if self.sink is not None:
+			return self.read_table("model_vars")
+		return self.model_recorder.to_dataframe()
+
+	def record_birth(self, agent, parent = None):
+		self.genomes[agent.type].record_birth(agent, parent, self.model.step_nr, self.genome_params(agent))
+
+	def genome_params(self, agent):
+		# the store columns hold the prey's model-scaled zr, za and dm, the
+		# parameter dicts are what the agent was born with
+		if agent.type == "prey":
+			return agent.evolvable_params
+		return agent.params
+
+	def record_death(self, agent):
+		self.genomes[agent.type].record_death(agent, self.model.step_nr)
 
 	def record_evolvable_params(self, model):
-		agents = model.schedule.agent_buffer()
-		for agent in agents:
-			if agent.type == "prey":
-				prey_dict = agent.evolvable_params.copy()
-				prey_dict["unique_id"] = agent.unique_id
-				if self.evolvable_params_prey.empty:
-					self.evolvable_params_prey = pd.DataFrame([prey_dict])
-					continue
-				if agent.unique_id in self.evolvable_params_prey["unique_id"].values:
-					continue
-				df = pd.DataFrame([prey_dict])
-				self.evolvable_params_prey = pd.concat([self.evolvable_params_prey, df])
-			
-			if agent.type == "predator":
-				pred_dict = agent.params.copy()
-				pred_dict["unique_id"] = agent.unique_id
-				if self.evolvable_params_predator.empty:
-					self.evolvable_params_predator = pd.DataFrame([pred_dict])
-					continue
-				if agent.unique_id in self.evolvable_params_predator["unique_id"].values:
-					continue
-				
-				df = pd.DataFrame([pred_dict])
-				self.evolvable_params_predator = pd.concat([self.evolvable_params_predator, df])
-	
+		# the genomes are already logged at birth, this only exports them
+		self.evolvable_params_prey = self.genomes["prey"].to_dataframe()
+		self.evolvable_params_predator = self.genomes["predator"].to_dataframe()
@@ -1,15 +1,144 @@
-from TypedAgent import TypedAgent
-# TODO temp
-import random
+import numpy as np
+from spatial_index import CellList
 
-class FoodAgent(TypedAgent):
-    """ Agent representing the resource items """
+
+class FoodLayer:
+    """ The resource items, kept as arrays instead of one agent per item
+
+    Items are referred to by their index. They never enter the schedule,
+    eaten items are only flagged in the alive mask and dropped from the
+    cell list used for the nearest-food queries.
+    """
     type = "food"
-    def __init__(self, unique_id, model):
-        super().__init__(unique_id, model)
-        self.position = (0, 0)
-        self.energy_value = 2  # called Er in paper
-        self.regrowth = None  
-
-    def step(self):
-        pass
\ No newline at end of file
+
+    def __init__(self, positions, width, height, cell_size, energy_value):
+        self.positions = np.asarray(positions, dtype=float).reshape(-1, 2)
+        n = len(self.positions)
+        self.alive = np.ones(n, dtype=bool)
+        self.er = np.full(n, float(energy_value))  # called Er in paper
+        self.n_alive = n
+        self.index = CellList(width, height, cell_size)
+        self.index.insert_many(range(n), self.positions)
+
+    def __len__(self):
+        return self.n_alive
+
+    def position(self, index):
+        return self.positions[index]
+
+    def is_alive(self, index):
+        return bool(self.alive[index])
+
+    def eat(self, index):
+        """Consume an item, returns the energy gained (0 if it was already eaten)."""
+        if not self.alive[index]:
+            return 0.0
+        self.alive[index] = False
+        self.index.remove(index)
+        self.n_alive -= 1
+        return self.er[index]
+
+    def nearest(self, pos, radius):
+        """Index of the closest living item within radius of pos, or None."""
+        found = self.index.query(pos, radius, include_center=True)
+        if not found:
+            return None
+        return min(found, key=lambda item: item[1])[0]
+
+    def alive_positions(self):
+        return self.positions[self.alive]
+
+
+class DensityFoodLayer:
+    """ Food for the full-scale world, stored as a count per grid cell
+
+    Only the number of items per cell is kept up front. The items of a cell
+    get their positions the first time a prey scans that cell, drawn from a
+    generator seeded with the cell id so they do not depend on scan order.
+    Item index = cell id * slots + slot within the cell.
+    """
+    type = "food"
+
+    def __init__(self, counts, width, height, seed, energy_value):
+        self.counts = np.asarray(counts)
+        self.n_x, self.n_y = self.counts.shape
+        self.width = width
+        self.height = height
+        self.cell_width = width / self.n_x
+        self.cell_height = height / self.n_y
+        self.slots = max(int(self.counts.max()), 1)
+        self.seed = seed
+        self.er = float(energy_value)  # called Er in paper
+        self.n_alive = int(self.counts.sum())
+        # cell id -> [positions, alive mask], only for cells scanned so far
+        self.materialized = {}
+
+    @classmethod
+    def random(cls, width, height, density, cell_size, seed, energy_value):
+        n_x = max(1, int(width // cell_size))
+        n_y = max(1, int(height // cell_size))
+        expected = density * (width / n_x) * (height / n_y)
+        counts = np.random.default_rng(seed).poisson(expected, size=(n_x, n_y)).astype(np.int32)
+        return cls(counts, width, height, seed, energy_value)
+
+    def __len__(self):
+        return self.n_alive
+
+    def cell_items(self, cx, cy):
+        cell = cx * self.n_y + cy
+        items = self.materialized.get(cell)
+        if items is None:
+            k = int(self.counts[cx, cy])
+            rng = np.random.default_rng([self.seed, cell])
+            offsets = rng.random((k, 2)) * (self.cell_width, self.cell_height)
+            positions = offsets + (cx * self.cell_width, cy * self.cell_height)
+            items = [positions, np.ones(k, dtype=bool)]
+            self.materialized[cell] = items
+        return items
+
+    def position(self, index):
+        cell, slot = divmod(index, self.slots)
+        return self.materialized[cell][0][slot]
+
+    def is_alive(self, index):
+        cell, slot = divmod(index, self.slots)
+        return bool(self.materialized[cell][1][slot])
+
+    def eat(self, index):
+        cell, slot = divmod(index, self.slots)
+        alive = self.materialized[cell][1]
+        if not alive[slot]:
+            return 0.0
+        alive[slot] = False
+        self.n_alive -= 1
+        return self.er
+
+    def _cell_range(self, centre, radius, cell_size, n):
+        lo = int(np.floor((centre - radius) / cell_size))
+        hi = int(np.floor((centre + radius) / cell_size))
+        if hi - lo + 1 >= n:
+            return range(n)
+        return [c % n for c in range(lo, hi + 1)]
+
+    def nearest(self, pos, radius):
+        best, best_dist = None, None
+        size = np.array([self.width, self.height])
+        for cx in self._cell_range(pos[0], radius, self.cell_width, self.n_x):
+            for cy in self._cell_range(pos[1], radius, self.cell_height, self.n_y):
+                positions, alive = self.cell_items(cx, cy)
+                if not alive.any():
+                    continue
+                delta = np.abs(positions - (pos[0], pos[1]))
+                delta = np.minimum(delta, size - delta)
+                dist = np.sqrt((delta * delta).sum(axis=1))
+                dist[~alive] = np.inf
+                slot = int(dist.argmin())
+                if dist[slot] <= radius and (best_dist is None or dist[slot] < best_dist):
+                    best, best_dist = (cx * self.n_y + cy) * self.slots + slot, dist[slot]
+        return best
+
+    def alive_positions(self):
+        # only what has been materialized, the rest was never seen by a prey
+        if not self.materialized:
+            return np.zeros((0, 2))
+        return np.concatenate([positions[alive] for positions, alive in self.materialized.values()])
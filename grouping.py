@@ -0,0 +1,186 @@
+import math
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+# Vectorized grouping rules. Every function works on whole arrays (one row
+# per agent), PreyAgent.new_move and PredatorAgent.group_move run them on a
+# single row so the per-agent and the batched path share the same turning
+# and stepping rules.
+
+def draw_turns(rng, n, k=3):
+    # per agent: angle when v_hat is zero, choice between ar/aa, sign of am
+    # (predators draw two more for a random direction when they get stuck)
+    return rng.random((n, k))
+
+
+def min_image(offset, size):
+    """Shortest offset between two points on the torus."""
+    return offset - size * np.round(offset / size)
+
+
+def rotate(v, a):
+    # same (skewed) rotation as the original per-agent code: vy uses the new vx
+    vx = v[:, 0] * np.cos(a) - v[:, 1] * np.sin(a)
+    vy = vx * np.cos(a) + v[:, 1] * np.sin(a)
+    return np.column_stack((vx, vy))
+
+
+def turn(v_hat, d_hat, ar, aa, am, draws, in_degrees=True):
+    """Turn v_hat towards d_hat within the limits ar/aa, then randomly by am.
+
+    Prey compare the angle in degrees, predators (in_degrees=False) compare
+    the angle in radians.
+    """
+    v_abs = np.sqrt(v_hat[:, 0] * v_hat[:, 0] + v_hat[:, 1] * v_hat[:, 1])
+    d_abs = np.sqrt(d_hat[:, 0] * d_hat[:, 0] + d_hat[:, 1] * d_hat[:, 1])
+    dot_product = v_hat[:, 0] * d_hat[:, 0] + v_hat[:, 1] * d_hat[:, 1]
+    safe_v_abs = np.where(v_abs == 0.0, 1.0, v_abs)
+    x = np.array([round(value, 2) for value in dot_product / safe_v_abs * d_abs])
+    angle = np.arccos(np.clip(x, -1.0, 1.0))
+    if in_degrees:
+        angle = np.abs(angle * (180.0 / math.pi))
+    random_angle = np.array([round(value, 2) for value in draws[:, 0] * math.pi])
+    angle = np.where(v_abs == 0.0, random_angle, angle)
+
+    towards = (angle <= ar) | (angle <= aa)
+    a = np.where(draws[:, 1] < 0.5, ar, aa)
+    v_hat = np.where(towards[:, None], d_hat, rotate(v_hat, a))
+
+    # random turn of a_M
+    t = np.where(draws[:, 2] < 0.5, -am, am)
+    return rotate(v_hat, t)
+
+
+def advance(positions, v_hat, dm, pm, size):
+    """New positions after moving dm along v_hat, wrapped onto the torus."""
+    stuck = (v_hat[:, 0] + v_hat[:, 1]) == 0.0
+    v_hat = np.where(stuck[:, None], np.column_stack((pm, pm)), v_hat)
+    new_positions = dm[:, None] * v_hat + positions
+    return v_hat, np.mod(new_positions, size)
+
+
+def advance_predators(positions, direction, max_speed, draws, size):
+    """Like advance, but stuck predators pick a random unit direction."""
+    stuck = (direction[:, 0] + direction[:, 1]) == 0.0
+    random_direction = draws[:, 3:5] / np.linalg.norm(draws[:, 3:5], axis=1)[:, None]
+    direction = np.where(stuck[:, None], random_direction, direction)
+    new_positions = max_speed[:, None] * direction + positions
+    return direction, np.mod(new_positions, size)
+
+
+def prey_directions(positions, v_hat, rows, zr, za, zl, nr):
+    """Desired direction d_hat of the prey in rows from their neighbours.
+
+    Neighbours are found as sparse pairs with a KD-tree, using the same plain
+    euclidean distance as PreyAgent.distance, and the repulsion, attraction
+    and alignment sums are reduced with bincount.
+    """
+    n = len(positions)
+    m = len(rows)
+    r_max = max(zr[rows].max(), za[rows].max(), zl[rows].max())
+    pairs = cKDTree(positions).query_pairs(r_max, output_type="ndarray")
+    i = np.concatenate((pairs[:, 0], pairs[:, 1]))
+    j = np.concatenate((pairs[:, 1], pairs[:, 0]))
+
+    # only rows that move need their sums, in their own numbering
+    row_of = np.full(n, -1)
+    row_of[rows] = np.arange(m)
+    keep = row_of[i] >= 0
+    i, j = i[keep], j[keep]
+    offset = positions[j] - positions[i]
+    dist = np.sqrt(offset[:, 0] * offset[:, 0] + offset[:, 1] * offset[:, 1])
+    keep = dist > 0
+    i, j, offset, dist = i[keep], j[keep], offset[keep], dist[keep]
+    unit = offset / dist[:, None]
+    k = row_of[i]
+
+    def reduce(mask, values):
+        return np.column_stack([np.bincount(k[mask], weights=values[mask, c], minlength=m)
+                                for c in range(2)])
+
+    in_zr = dist <= zr[i]
+    in_za = dist <= za[i]
+    in_zl = dist <= zl[i]
+    nrz = np.bincount(k[in_zr], minlength=m)
+    sum0 = reduce(in_zr, unit)
+    sum1 = reduce(in_za, -unit)
+    sum2 = reduce(in_zl, v_hat[j])
+
+    # repulsion
+    abs_sum = np.sqrt(sum0[:, 0] * sum0[:, 0] + sum0[:, 1] * sum0[:, 1])
+    repulse = np.where((abs_sum != 0)[:, None], -sum0 / np.where(abs_sum == 0, 1.0, abs_sum)[:, None], -sum0)
+    # attraction and alignment
+    sums = sum1 + sum2
+    abs_sums = np.sqrt(sums[:, 0] * sums[:, 0] + sums[:, 1] * sums[:, 1])
+    attract = np.where((abs_sums != 0)[:, None], -sums / np.where(abs_sums == 0, 1.0, abs_sums)[:, None], 0.0)
+    return np.where((nrz >= nr[rows])[:, None], repulse, attract)
+
+
+def batched_prey_moves(model, states):
+    """Headings and positions of every prey in one of the given states.
+
+    Computed in one pass from the current state of model.prey_store, returns
+    {agent: (v_hat, new_position)} for PreyAgent.new_move to pick up.
+    """
+    store = model.prey_store
+    codes = store.view("state")
+    rows = np.flatnonzero(np.isin(codes, [state.value for state in states]))
+    if len(rows) == 0:
+        return {}
+    positions = store.view("position")
+    v_hat = store.view("heading")
+    zl = np.array([agent.zl for agent in store.agents], dtype=float)
+    d_hat = prey_directions(positions, v_hat, rows, store.genome_column("zr"),
+                            store.genome_column("za"), zl, store.genome_column("nr"))
+    new_v_hat = turn(v_hat[rows], d_hat, store.genome_column("ar")[rows],
+                     store.genome_column("aa")[rows], store.genome_column("am")[rows],
+                     draw_turns(model.rng, len(rows)))
+    size = np.array([model.grid.width, model.grid.height])
+    new_v_hat, new_positions = advance(positions[rows], new_v_hat, store.genome_column("dm")[rows],
+                                       store.genome_column("pm")[rows], size)
+    agents = [store.agents[row] for row in rows]
+    return {agent: (h, p) for agent, h, p in zip(agents, new_v_hat, new_positions)}
+
+
+def predator_directions(positions, direction, rows, alignment, r_attraction, awareness, size):
+    """Desired direction d_hat of the predators in rows.
+
+    Uses one (rows x predators) matrix of minimum-image offsets. The
+    repulsion sum is left out: group_move overwrites its direction with the
+    alignment/attraction one anyway.
+    """
+    offset = min_image(positions[None, :, :] - positions[rows, None, :], size)
+    dist = np.sqrt(offset[..., 0] * offset[..., 0] + offset[..., 1] * offset[..., 1])
+    near = dist <= awareness[rows, None]
+    unit = offset / np.where(dist == 0, 1.0, dist)[..., None]
+    in_align = near & (dist <= alignment[rows, None]) & (dist != 0)
+    in_attract = near & (dist <= r_attraction[rows, None])
+    sums = (unit * in_align[..., None]).sum(axis=1) + in_attract.astype(float) @ direction
+    abs_sums = np.sqrt(sums[:, 0] * sums[:, 0] + sums[:, 1] * sums[:, 1])
+    return np.where((abs_sums != 0)[:, None], -sums / np.where(abs_sums == 0, 1.0, abs_sums)[:, None], 0.0)
+
+
+def batched_predator_moves(model, states):
+    """Directions and positions of every predator in one of the given states."""
+    store = model.predator_store
+    codes = store.view("state")
+    rows = np.flatnonzero(np.isin(codes, [state.value for state in states]))
+    if len(rows) == 0:
+        return {}
+    positions = store.view("position")
+    direction = store.view("heading")
+    agents = store.agents
+    size = np.array([model.grid.width, model.grid.height])
+    alignment = np.array([agent.alignment for agent in agents], dtype=float)
+    awareness = np.array([agent.max_neighbour_awareness for agent in agents], dtype=float)
+    d_hat = predator_directions(positions, direction, rows, alignment,
+                                store.genome_column("r_attraction"), awareness, size)
+    draws = draw_turns(model.rng, len(rows), 5)
+    new_direction = turn(direction[rows], d_hat, store.genome_column("angle_repulsion")[rows],
+                         store.genome_column("angle_attraction")[rows],
+                         store.genome_column("angle_move")[rows], draws, in_degrees=False)
+    max_speed = np.array([agents[row].max_speed for row in rows], dtype=float)
+    new_direction, new_positions = advance_predators(positions[rows], new_direction, max_speed, draws, size)
+    return {agents[row]: (h, p) for row, h, p in zip(rows, new_direction, new_positions)}
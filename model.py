@@ -1,21 +1,43 @@
 import mesa
-from mesa.time import RandomActivation
-from predator import PredatorAgent
-from prey import PreyAgent
-from food import FoodAgent
+import gzip
+import os
+import pickle
+from predator import PredatorAgent, Predator_State, PREDATOR_GENOME
+from prey import PreyAgent, Prey_State, PREY_GENOME, mutate_batch as prey_mutate_batch
+from food import FoodLayer, DensityFoodLayer
 from data_collector import DataCollector
-from scipy.spatial import distance
+from spatial_index import SpatialIndex, NeighbourCache
+from agent_store import AgentStore, ReadBuffer
+from agent_pool import AgentPool
+from scheduler import TypedActivation, WheelActivation
 import numpy as np
 import random
 import predator_params as pred_params
+import prey_params
+import setup
+import grouping
+import population
 import uuid
 
 class Model(mesa.Model):
     """A model with some number of agents."""
     # grid = None
-
-    def __init__(self, N, width, height, attack_distance, evolve, n_prey = None, n_pred = None):
+    # True while the schedule steps, births and deaths wait for the end of it
+    stepping = False
+    # True only while the agents of a synchronous step are being activated
+    deferring = False
+
+    def __init__(self, N, width, height, attack_distance, evolve, n_prey = None, n_pred = None,
+                 batched = False, full_scale = False, neighbour_search = "cells", verlet_skin = 5,
+                 scheduler = "random", synchronous = False, agent_pool = False, seed = None, results_dir = None, record_agents = False, initial_population = None):
         super().__init__()
+        self.seed_generators(seed)
+        # initial prey all start from this draw of the evolvable parameters
+        self.evolvable_params_prey = prey_params.sample_evolvable_params_prey(self.rng)
+        # full_scale runs the real field geometry (see setup.FULL_SCALE_WIDTH)
+        # instead of rescaling the distance parameters with setup.PROPORTION
+        self.full_scale = full_scale
+        self.proportion = 1.0 if full_scale else setup.PROPORTION
         # agent counts
         self.step_nr = 0
         if n_prey is None:
@@ -32,165 +54,481 @@ class Model(mesa.Model):
 
         # init environment
         self.grid = mesa.space.ContinuousSpace(width, height, True)
-        self.schedule = RandomActivation(self)
+        # per-type cell lists, cells sized to the radius each type is queried with
+        query_radii = {
+            "prey": prey_params.default_params_prey["zl"],
+            "predator": pred_params.default_params_predator["max_neighbour_awareness"]
+        }
+        self.spatial_index = SpatialIndex(width, height, query_radii)
+        # neighbour search backend: "cells" queries the cell lists every time,
+        # "verlet" keeps per-agent candidate lists within radius + verlet_skin
+        if neighbour_search == "verlet":
+            for type, radius in query_radii.items():
+                self.spatial_index.use_verlet(type, radius, verlet_skin)
+        elif neighbour_search != "cells":
+            raise ValueError("unknown neighbour_search backend: %s" % neighbour_search)
+        self.neighbour_search = neighbour_search
+        # keeps the prey and predators grouped by type as they are added/removed;
+        # "wheel" only activates agents that are not sleeping through an action
+        if scheduler == "wheel":
+            self.schedule = WheelActivation(self)
+        elif scheduler == "random":
+            self.schedule = TypedActivation(self)
+        else:
+            raise ValueError("unknown scheduler: %s" % scheduler)
+        self.scheduler = scheduler
+        # memo of each agent's neighbour queries within one step
+        self.neighbour_cache = NeighbourCache(self.spatial_index)
+        # columnar state of the living prey and predators
+        self.prey_store = AgentStore(PREY_GENOME)
+        self.predator_store = AgentStore(PREDATOR_GENOME)
+
+        # data, created before the agents so it can log their genomes at birth
+        self.data_collector = DataCollector(self)
+        # stream the collected data to results_dir instead of keeping it in memory
+        if results_dir is not None:
+            self.data_collector.stream_to(results_dir, record_agents=record_agents)
 
         # init agents
         self.attack_distance = attack_distance
         self.evolve = evolve
-        self.create_prey(self.num_prey_agents)
-        self.create_predators(self.num_predator_agents,
-                              self.attack_distance, self.evolve)
-        self.create_food(self.num_resources)
-
-        # the schedule alredy has all agents, this might make every
-        # timestep a little bit more efficient
-        self.prey = []
-        self.predators = []
-        self.food = []
-
-        # data
-        self.data_collector = DataCollector(self)
-        self.n_agents_per_type = None
-        self.update_model_data()
-
-        # kill list
-        self.remove_agents_food = []
+        if initial_population is not None:
+            # warm start from population.export_population (or a file of it)
+            if isinstance(initial_population, str):
+                initial_population = population.load_population(initial_population)
+            self.num_prey_agents = len(initial_population["prey_params"])
+            self.num_predator_agents = len(initial_population["predator_params"])
+            self.create_population(initial_population)
+        else:
+            self.create_prey(self.num_prey_agents)
+            self.create_predators(self.num_predator_agents,
+                                  self.attack_distance, self.evolve)
+        if self.full_scale:
+            self.create_food_density(self.num_resources)
+        else:
+            self.create_food(self.num_resources)
+        # the food only counts, it has no step of its own
+        self.schedule.add_passive("food", self.food_layer)
+
+        # per-step KD-tree snapshots per agent type and the batched answers
+        # for the predators that scan this step
+        self.snapshots = {}
+        self.scan_results = {}
+
+        # batched engine mode: grouping moves of all moving prey and all
+        # searching predators are computed in one vectorized pass per step
+        self.batched = batched
+        self.moves = {}
+
+        # synchronous mode: the agents of a step all see the world as it was
+        # at its start (frozen store columns, spatial index and food), their
+        # moves, births, deaths and eat/kill claims are applied after all of
+        # them stepped. Competing claims go to the lowest unique_id.
+        self.synchronous = synchronous
+        self.read_buffer = ReadBuffer((self.prey_store, self.predator_store))
+        if synchronous:
+            self.schedule.buffer = self.read_buffer
+        self.pending_moves = {}
+        self.pending_places = {}
+        self.food_claims = {}
+        self.kill_claims = {}
+
+        # offspring (unmutated params, parent) and the dead of the current
+        # step, applied in one batch after the schedule stepped
+        self.births = {"prey": [], "predator": []}
+        self.pending_deaths = {}
+        # agent_pool: dead agents are reset and reused for the offspring
+        # instead of constructing new ones
+        self.pools = {"prey": AgentPool(), "predator": AgentPool()} if agent_pool else None
+
+    def seed_generators(self, seed):
+        # every random draw of a run comes from generators spawned from one
+        # SeedSequence: self.random (python, activation order, an instance
+        # attribute as mesa shares the one it makes between models) and
+        # self.rng (numpy, placement, the agents and parameter sampling)
+        self.seed_sequence = np.random.SeedSequence(seed)
+        python_seed, numpy_seed = self.seed_sequence.spawn(2)
+        self.random = random.Random(int(python_seed.generate_state(1, np.uint64)[0]))
+        self.rng = np.random.default_rng(numpy_seed)
+
+    @classmethod
+    def from_template(cls, template, seed=None, results_dir=None, record_agents=False):
+        """Copy of an already built model with fresh random generators.
+
+        Building the world once and cloning it per replicate skips the
+        agent, space and food setup; the replicates share the initial world
+        and differ in everything drawn from seed afterwards. A template can
+        also be built in the parent process and cloned in pool workers.
+        """
+        if template.data_collector.sink is not None:
+            raise ValueError("template model must not stream its data, pass results_dir here instead")
+        model = pickle.loads(pickle.dumps(template, protocol=pickle.HIGHEST_PROTOCOL))
+        model.seed_generators(seed)
+        if results_dir is not None:
+            model.data_collector.stream_to(results_dir, record_agents=record_agents)
+        return model
 
     def step(self):
         """Advance the model by one step."""
         self.data_collector.collect(self)
+        self.snapshots = {}
+        self.neighbour_cache.new_step()
+        self.spatial_index.new_step()
+        self.scan_predators()
+        if self.batched:
+            self.moves = grouping.batched_prey_moves(
+                self, (Prey_State.MOVING, Prey_State.FLEEING))
+            self.moves.update(grouping.batched_predator_moves(
+                self, (Predator_State.SEARCHING,)))
 
         # model shuffles the order of the agents, then activates and executes each agent’s step method
-        self.schedule.step()
-        self.update_model_data()
-        for x in self.remove_agents_food:  # need to remove food agents taht have been eaten by prey
-            self.schedule.remove(x)
-            self.remove_agents_food.remove(x)
+        self.stepping = True
+        if self.synchronous:
+            self.read_buffer.freeze()
+            self.deferring = True
+            self.schedule.step()
+            self.commit()
+        else:
+            self.schedule.step()
+        self.stepping = False
+        self.create_offspring()
+        self.remove_dead()
         self.step_nr += 1
 
-    def create_prey(self, num_prey_agents):
-        # Create prey agents
-
-        for i in range(num_prey_agents):
-
-            a = PreyAgent(self.next_id(), self)
-
-            self.schedule.add(a)
-
-
-            # Add the agent to a random grid cell
-            x = self.random.random() * self.grid.x_max
-            y = self.random.random() * self.grid.y_max
-            pos = np.array((x, y))
-            self.grid.place_agent(a, pos)
-            a.set_position(pos)
+    def commit(self):
+        """Second phase of a synchronous step, apply what the agents did."""
+        self.deferring = False
+        self.read_buffer.thaw()
+        for agent, pos in self.pending_moves.items():
+            self.move_agent(agent, pos)
+        for agent, pos in self.pending_places.items():
+            self.place_agent(agent, pos)
+        for item, prey in self.food_claims.items():
+            prey.energy += self.food_layer.eat(item)
+        for target, predator in self.kill_claims.items():
+            predator.consume(target)
+        self.pending_moves = {}
+        self.pending_places = {}
+        self.food_claims = {}
+        self.kill_claims = {}
+
+    def queue_birth(self, type, params, parent=None):
+        """Offspring of parent, created by create_offspring at the end of the step.
+
+        params are the parent's (copied, not yet mutated) parameters. The
+        population counter goes up right away, as it did for an immediate birth.
+        """
+        self.births[type].append((params, parent))
+        if type == "prey":
             self.num_prey_agents += 1
+        else:
+            self.num_predator_agents += 1
 
-    def create_new_prey(self, evolv_params):
-
-        a = PreyAgent(self.next_id(), self, evolvable_params=evolv_params)
-
-        a.set_energy(a.max_energy / 2)
-        self.schedule.add(a)
-
-        # Add the agent to a random grid cell
-        x = self.random.random() * self.grid.x_max
-        y = self.random.random() * self.grid.y_max
-        pos = np.array((x, y))
-        self.grid.place_agent(a, pos)
-        a.set_position(pos)
-        self.num_prey_agents += 1
-
-    def create_new_predator(self, params):
-
-        agent = PredatorAgent(self.next_id(), self,
-                              self.attack_distance, params, evolve=self.evolve)
+    def create_offspring(self):
+        """Create all queued offspring: mutated, added and placed in bulk."""
+        births, self.births = self.births, {"prey": [], "predator": []}
+        if births["prey"]:
+            params = prey_mutate_batch([params for params, _ in births["prey"]], self.rng)
+            agents = [self.new_agent("prey", p) for p in params]
+            for a in agents:
+                a.set_energy(a.max_energy / 2)
+            self.add_offspring(agents, births["prey"], "prey")
+        if births["predator"]:
+            params = pred_params.mutate_params_batch([params for params, _ in births["predator"]], self.rng)
+            agents = [self.new_agent("predator", p) for p in params]
+            for a in agents:
+                a.set_energy(a.max_energy / 2)
+            self.add_offspring(agents, births["predator"], "predator")
+
+    def new_agent(self, type, params):
+        agent = self.pools[type].acquire() if self.pools is not None else None
+        if agent is not None:
+            agent.reset(self.next_id(), params)
+        elif type == "prey":
+            agent = PreyAgent(self.next_id(), self, evolvable_params=params)
+        else:
+            agent = PredatorAgent(self.next_id(), self, self.attack_distance, params, evolve=self.evolve)
+        return agent
+
+    def add_offspring(self, agents, births, type):
+        self.schedule.add_agents(agents)
+        for a, (_, parent) in zip(agents, births):
+            self.data_collector.record_birth(a, parent)
+        self.place_agents(agents, self.random_positions(len(agents)), type)
+
+    def remove_dead(self):
+        """Take the agents that died during the step out of the model, in one batch."""
+        if not self.pending_deaths:
+            return
+        dead, self.pending_deaths = list(self.pending_deaths), {}
+        for agent in dead:
+            self.schedule.remove(agent)
+            self.data_collector.record_death(agent)
+        self.remove_agents([agent for agent in dead if agent.pos is not None])
+        for agent in dead:
+            if agent._store is not None:
+                agent._store.detach(agent)
+            if self.pools is not None:
+                self.pools[agent.type].release(agent)
+
+    def claim(self, claims, item, agent):
+        # the lowest unique_id wins an item claimed by several agents
+        holder = claims.get(item)
+        if holder is None or agent.unique_id < holder.unique_id:
+            claims[item] = agent
+
+    def eat_food(self, prey, item):
+        """Energy prey gains from eating item, claimed for now in a synchronous step."""
+        if self.deferring:
+            self.claim(self.food_claims, item, prey)
+            return 0.0
+        return self.food_layer.eat(item)
 
-        agent.set_energy(agent.max_energy / 2)
-        self.schedule.add(agent)
-        x = random.uniform(0, self.grid.x_max)
-        y = random.uniform(0, self.grid.y_max)
-        self.grid.place_agent(agent, (x, y))
-        agent.set_position((x, y))
-        self.num_predator_agents += 1
+    def create_prey(self, num_prey_agents):
+        # Create prey agents, added and placed in bulk at random positions
+        agents = [PreyAgent(self.next_id(), self) for i in range(num_prey_agents)]
+        self.schedule.add_agents(agents)
+        for a in agents:
+            self.data_collector.record_birth(a)
+        self.place_agents(agents, self.random_positions(len(agents)), "prey")
+        self.num_prey_agents += len(agents)
 
     def create_predators(self, num_predator_agents, attack_distance, evolve):
         # Create predator agents
         params = pred_params.get_default_params_predator()
 
+        agents = []
         for i in range(self.num_prey_agents+1, self.num_prey_agents + num_predator_agents):
             if evolve:
-                params = pred_params.mutate_params(params)
-            a = PredatorAgent(self.next_id(), self,
-                              attack_distance, evolve=evolve)
+                params = pred_params.mutate_params(params, self.rng)
+            agents.append(PredatorAgent(self.next_id(), self,
+                                        attack_distance, evolve=evolve))
+        self.schedule.add_agents(agents)
+        for a in agents:
+            self.data_collector.record_birth(a)
+        self.place_agents(agents, self.random_positions(len(agents)), "predator")
+        self.num_predator_agents += len(agents)
+
+    def create_population(self, snapshot):
+        # agents from an exported population, with their positions, energies
+        # and ages if the snapshot has them (random positions otherwise)
+        prey_names = [str(name) for name in snapshot["prey_param_names"]]
+        # mutation only touches the first key, so the reloaded dicts keep the
+        # key order of freshly sampled ones whatever order the snapshot has
+        genome_names = list(self.evolvable_params_prey)
+        if len(snapshot["prey_params"]) and sorted(prey_names) != sorted(genome_names):
+            raise ValueError("snapshot prey params %s do not match the prey genome %s" % (prey_names, genome_names))
+        for i, row in enumerate(snapshot["prey_params"]):
+            loaded = dict(zip(prey_names, row))
+            a = PreyAgent(self.next_id(), self, evolvable_params={name: loaded[name] for name in genome_names})
+            self.schedule.add(a)
+            self.data_collector.record_birth(a)
+            self.place_snapshot_agent(a, snapshot, "prey", i)
+            self.num_prey_agents += 1
+
+        predator_names = [str(name) for name in snapshot["predator_param_names"]]
+        for i, row in enumerate(snapshot["predator_params"]):
+            params = pred_params.get_default_params_predator()
+            params.update(zip(predator_names, row))
+            a = PredatorAgent(self.next_id(), self, self.attack_distance, params, evolve=self.evolve)
             self.schedule.add(a)
-            # Add the agent to a random grid cell
-            x = self.random.random() * self.grid.x_max
-            y = self.random.random() * self.grid.y_max
-            pos = np.array((x, y))
-            self.grid.place_agent(a, pos)
-            a.set_position(pos)
+            self.data_collector.record_birth(a)
+            self.place_snapshot_agent(a, snapshot, "predator", i)
             self.num_predator_agents += 1
 
+    def place_snapshot_agent(self, agent, snapshot, type, i):
+        if type + "_position" in snapshot:
+            pos = snapshot[type + "_position"][i]
+            agent.energy = snapshot[type + "_energy"][i]
+            agent.age = snapshot[type + "_age"][i]
+        else:
+            pos = (self.random.random() * self.grid.x_max, self.random.random() * self.grid.y_max)
+        self.place_agent(agent, np.array(pos, dtype=float))
+
+    def export_population(self, include_state=True):
+        return population.export_population(self, include_state)
+
     def create_food(self, num_resources):
-        # Place food items
-        for resource in range(int(num_resources)):
-            a = FoodAgent(self.next_id(), self)
-            self.schedule.add(a)
-            x = self.random.random() * self.grid.x_max
-            y = self.random.random() * self.grid.y_max
-            pos = np.array((x, y))
-            self.grid.place_agent(a, pos)
-            a.set_position(pos)
-            self.num_resources += 1
+        # Place food items, they live in an array layer outside the schedule
+        positions = self.random_positions(int(num_resources))
+        self.num_resources += len(positions)
+        self.food_layer = FoodLayer(positions, self.grid.width, self.grid.height,
+                                    prey_params.default_params_prey["max_neighbour_awareness"],
+                                    prey_params.default_params_prey["er"])
+
+    def create_food_density(self, num_resources):
+        # ~17 million items at full scale: only keep a count per cell, items
+        # are materialized when a prey scans their cell
+        self.food_layer = DensityFoodLayer.random(
+            self.grid.width, self.grid.height, num_resources / (self.grid.width * self.grid.height),
+            prey_params.default_params_prey["max_neighbour_awareness"], self.random.getrandbits(32),
+            prey_params.default_params_prey["er"])
+        self.num_resources += len(self.food_layer)
+
+    def random_positions(self, n):
+        # n uniform positions in the space as one (n, 2) array
+        return self.rng.random((n, 2)) * (self.grid.x_max, self.grid.y_max)
+
+    def place_agents(self, agents, positions, type):
+        """place_agent for a list of agents of one type at once."""
+        positions = [self.grid.torus_adj(pos) for pos in positions]
+        # ContinuousSpace only places one agent at a time (each one copying
+        # its point array), so its bookkeeping is filled in directly here
+        grid = self.grid
+        start = 0 if grid._agent_points is None else len(grid._agent_points)
+        points = np.array(positions, dtype=float).reshape(-1, 2)
+        if grid._agent_points is None:
+            grid._agent_points = points
+        else:
+            grid._agent_points = np.concatenate((grid._agent_points, points))
+        for i, (agent, pos) in enumerate(zip(agents, positions)):
+            grid._index_to_agent[start + i] = agent
+            grid._agent_to_index[agent] = start + i
+            agent.pos = pos
+            agent.set_position(pos)
+        self.spatial_index.insert_many(agents, points, type)
+
+    def place_agent(self, agent, pos):
+        if self.deferring:
+            # the agent knows where it is, the others only see it after the commit
+            agent.pos = self.grid.torus_adj(pos)
+            agent.set_position(pos)
+            self.pending_places[agent] = pos
+            return
+        self.grid.place_agent(agent, pos)
+        self.spatial_index.insert(agent, agent.pos)
+        agent.set_position(pos)
+
+    def move_agent(self, agent, pos):
+        if self.deferring:
+            agent.pos = self.grid.torus_adj(pos)
+            self.pending_moves[agent] = pos
+            return
+        self.grid.move_agent(agent, pos)
+        self.spatial_index.move(agent, agent.pos)
+
+    def remove_agent(self, agent):
+        self.grid.remove_agent(agent)
+        self.spatial_index.remove(agent)
+
+    def remove_agents(self, agents):
+        """remove_agent for many agents, the space is compacted once instead of per agent."""
+        if not agents:
+            return
+        grid = self.grid
+        keep = np.ones(len(grid._agent_points), dtype=bool)
+        for agent in agents:
+            keep[grid._agent_to_index.pop(agent)] = False
+            self.spatial_index.remove(agent)
+            agent.pos = None
+        grid._agent_points = grid._agent_points[keep]
+        new_index = np.cumsum(keep) - 1
+        grid._index_to_agent = {}
+        for agent, index in grid._agent_to_index.items():
+            index = int(new_index[index])
+            grid._agent_to_index[agent] = index
+            grid._index_to_agent[index] = agent
+
+    def neighbors_of_type(self, pos, radius, type, include_center=False):
+        """Agents of the given type within radius of pos (torus aware)."""
+        return [agent for agent, _ in self.spatial_index.query(pos, radius, type, include_center)]
+
+    def cached_neighbors_of_type(self, agent, radius, type, include_center=False, max_radius=None):
+        """neighbors_of_type around agent.pos, answered from the per-step cache.
+
+        max_radius is the largest radius the agent queries this type with,
+        the first query fetches that much so later ones are cache hits.
+        """
+        found = self.neighbour_cache.query(agent, agent.pos, radius, type, include_center, max_radius)
+        return [neighbour for neighbour, _ in found]
+
+    @property
+    def prey(self):
+        # live view, kept up to date by the schedule on every add/remove
+        return self.schedule.agents_of_type("prey")
+
+    @property
+    def predators(self):
+        return self.schedule.agents_of_type("predator")
+
+    @property
+    def n_agents_per_type(self):
+        return {type: self.schedule.get_type_count(type) for type in ("prey", "predator", "food")}
 
     def get_n_agents_per_type(self):
         return self.n_agents_per_type
 
-    def update_model_data(self):
-        agent_buffer = self.schedule.agent_buffer()
-        self.n_agents_per_type = {"prey": 0, "predator": 0, "food": 0}
-        # loop twice is more efficient then reallocating in inner loop
-        for agent in agent_buffer:
-            self.n_agents_per_type[agent.get_type()] += 1
-        # Allocate all lists (once for efficiency)
-        self.prey = [None] * self.n_agents_per_type["prey"]
-        self.predators = [None] * self.n_agents_per_type["predator"]
-        self.food = [None] * self.n_agents_per_type["food"]
-        #  update separate agent lists
-        prey_idx, predator_idx, food_idx = 0, 0, 0
-        agent_buffer = self.schedule.agent_buffer()
-        for agent in agent_buffer:
-            if agent.get_type() == "prey":
-                self.prey[prey_idx] = agent
-                prey_idx += 1
-                continue
-            if agent.get_type() == "predator":
-                self.predators[predator_idx] = agent
-                predator_idx += 1
-                continue
-            if agent.get_type() == "food":
-                self.food[food_idx] = agent
-                food_idx += 1
+    def get_pool_stats(self):
+        """Occupancy and reuse of the agent pools per type (empty without agent_pool)."""
+        if self.pools is None:
+            return {}
+        return {type: pool.stats() for type, pool in self.pools.items()}
+
+    def get_neighbour_search_stats(self):
+        """Rebuild statistics of the Verlet lists per type (empty for the cell backend)."""
+        return {type: verlet.stats() for type, verlet in self.spatial_index.verlet.items()}
+
+    def get_neighbour_cache_stats(self):
+        """Hits and misses of the per-step neighbour query cache."""
+        return self.neighbour_cache.stats()
+
+    def get_snapshot(self, type):
+        # positions are frozen at the first query of the step
+        if type not in self.snapshots:
+            self.snapshots[type] = self.spatial_index.snapshot(type)
+        return self.snapshots[type]
 
     def get_closest_agent_of_type_in_range(self, pos, type, range):
-        agent_list = []
-        if type == "prey":
-            agent_list = self.prey
-        if type == "predator":
-            agent_list = self.predators
-        if type == "food":
-            agent_list = self.food
-
-        ret_agent = None
-        d_min = 50
-        for agent in agent_list:
-            dist = distance.euclidean(pos, agent.get_position())
-            if dist <= d_min and dist <= range:
-                ret_agent = agent
-                d_min = dist
-                break
-        return ret_agent
+        return self.get_snapshot(type).closest(pos, range)
+
+    def get_closest_agents_of_type_in_range(self, positions, type, ranges):
+        """Batched form of get_closest_agent_of_type_in_range."""
+        return self.get_snapshot(type).closest_many(positions, ranges)
+
+    def scan_predators(self):
+        # answer the prey query of every scanning predator in one go
+        scanning = [predator for predator in self.predators
+                    if predator.get_state() == Predator_State.SCANNING]
+        targets = self.get_closest_agents_of_type_in_range(
+            [predator.pos for predator in scanning], "prey",
+            [predator.prey_detection_range for predator in scanning])
+        self.scan_results = dict(zip(scanning, targets))
+
+    def get_scan_result(self, predator):
+        if predator in self.scan_results:
+            return self.scan_results.pop(predator)
+        return self.get_closest_agent_of_type_in_range(
+            predator.pos, "prey", predator.prey_detection_range)
+
+    def take_move(self, agent):
+        # a precomputed move is only used once, a second move in the same
+        # step (flee + move) is computed per agent
+        return self.moves.pop(agent, None)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # KD-tree snapshots are rebuilt on demand, no need to store them
+        state["snapshots"] = {}
+        return state
+
+    def save_checkpoint(self, path):
+        """Write the whole model state to a gzipped pickle.
+
+        Everything hangs off the model, so this covers the schedule, the
+        agent stores (states, targets and food targets included), the space
+        and spatial index, the random generators and the data collected so
+        far. The file is written next to path first, an interrupted save
+        never leaves a broken checkpoint behind.
+        """
+        with gzip.open(path + ".tmp", "wb") as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + ".tmp", path)
+
+    @staticmethod
+    def load_checkpoint(path):
+        """Model saved with save_checkpoint, continues from the step it was saved at."""
+        with gzip.open(path, "rb") as f:
+            return pickle.load(f)
 
     def get_predators(self):
         return self.predators
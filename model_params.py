@@ -49,3 +49,12 @@ model_params_no_evolve_9 = {
     "attack_distance": 9,
     "evolve": False
 }
+
+model_params_full_scale_5 = {
+    "N": setup.N_AGENTS,
+    "width": setup.FULL_SCALE_WIDTH,
+    "height": setup.FULL_SCALE_HEIGHT,
+    "attack_distance": 5,
+    "evolve": True,
+    "full_scale": True
+}
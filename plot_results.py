@@ -1,7 +1,15 @@
 from data_collector import DataCollector as DC
+from chunk_store import ChunkReader
 from matplotlib import pyplot as plt
 import numpy as np
 import pandas as pd
+import os
+
+def load_results(path):
+	# BatchRun writes either path.csv or a chunk_store directory at path
+	if os.path.isdir(path):
+		return ChunkReader(path).to_dataframe("global_overview")
+	return pd.read_csv(path + ".csv")
 
 def plot_populations(dc):
 
@@ -82,7 +90,7 @@ def plot_D(df, path):
 
 dfs = []
 for idx in range(6):
-	df = pd.read_csv("./results/batch{0}_300.csv".format(idx))
+	df = load_results("./results/batch{0}_300".format(idx))
 	dfs.append(df)
 
 plot_A(dfs[:3], "./results/vig_vs_pred_evolve.png")
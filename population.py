@@ -0,0 +1,41 @@
+import numpy as np
+
+from agent_store import as_scalar
+from predator import PREDATOR_GENOME
+
+
+def export_population(model, include_state=True):
+    """Snapshot of the living prey and predators of a model.
+
+    The prey keep their unscaled evolvable parameters (PreyAgent rescales
+    some of them with the model's proportion), the predators their genome.
+    With include_state the positions, energies and ages are exported too.
+    Pass the result (or the file written by save_population) to
+    Model(initial_population=...) to start a run from this population.
+    """
+    prey = list(model.prey_store.agents)
+    predators = list(model.predator_store.agents)
+    prey_names = list(prey[0].evolvable_params) if prey else []
+    snapshot = {
+        "step": np.array(model.step_nr),
+        "prey_param_names": np.array(prey_names, dtype=str),
+        "prey_params": np.array([[as_scalar(agent.evolvable_params[name]) for name in prey_names]
+                                 for agent in prey], dtype=float).reshape(len(prey), len(prey_names)),
+        "predator_param_names": np.array(PREDATOR_GENOME, dtype=str),
+        "predator_params": model.predator_store.genome[:len(predators)].copy(),
+    }
+    if include_state:
+        for type, store in (("prey", model.prey_store), ("predator", model.predator_store)):
+            snapshot[type + "_position"] = store.view("position").copy()
+            snapshot[type + "_energy"] = store.view("energy").copy()
+            snapshot[type + "_age"] = store.view("age").copy()
+    return snapshot
+
+
+def save_population(snapshot, path):
+    np.savez_compressed(path, **snapshot)
+
+
+def load_population(path):
+    with np.load(path) as data:
+        return {name: data[name] for name in data.files}
@@ -2,14 +2,14 @@ import mesa
 from enum import Enum
 import numpy as np
 from TypedAgent import TypedAgent
+from agent_store import column_property, vector_property, state_property, genome_property
 from prey import Prey_State
 import predator_params
+import grouping
 from scipy.spatial.distance import euclidean as dist
 import setup
 from scipy.stats import truncnorm
-from copy import deepcopy
 import math
-import random
 
 
 
@@ -21,9 +21,27 @@ class Predator_State(Enum):
     DEAD = 5
 
 
+# mutable parameters kept in the genome columns of the predator AgentStore
+PREDATOR_GENOME = ("t_food_scan", "r_repulsion", "r_attraction",
+                   "angle_repulsion", "angle_attraction", "angle_move")
+
+
 class PredatorAgent(TypedAgent):
     """An agent that is a predator"""
 
+    # columns of model.predator_store, the agent itself only holds its row
+    position = vector_property("position")
+    direction = vector_property("heading")
+    energy = column_property("energy")
+    age = column_property("age")
+    state = state_property(Predator_State)
+    t_food_scan = genome_property("t_food_scan")
+    r_repulsion = genome_property("r_repulsion")
+    r_attraction = genome_property("r_attraction")
+    angle_repulsion = genome_property("angle_repulsion")
+    angle_attraction = genome_property("angle_attraction")
+    angle_move = genome_property("angle_move")
+
     def __init__(self, unique_id, model, attack_distance,
                  params=predator_params.default_params_predator, evolve=False):
         super().__init__(unique_id, model, params)
@@ -31,21 +49,11 @@ class PredatorAgent(TypedAgent):
 
         # not variable parameters, these are always the same at construction
         self.type = "predator"
-        self.state = Predator_State.SEARCHING
         self.min_energy = 0
-        self.t_current_activity = 0
-        # will be a prey object
-        self.target = None
         # for moving to a location will be a tuple
         # self.destination = None
         self.model = model
-        self.nearby_predators = []
-        self.nearby_prey = []
         self.evolve = evolve
-        # set random initial direction
-        self.direction = np.array([random.random(), random.random()])
-        self.direction /= np.linalg.norm(self.direction)
-        # print("direction normalize self.direction: ", self.direction)
 
         # constants-------------------------------------------------------------
         # called eM in paper
@@ -58,16 +66,9 @@ class PredatorAgent(TypedAgent):
         self.offspring_energy = params["offspring_energy"]
         # constants-------------------------------------------------------------
 
-        # internal state--------------------------------------------------------
-        self.position = params["position"]
-        self.energy = params["initial_energy"]
-        # internal state--------------------------------------------------------
-
         # perception------------------------------------------------------------
         # search angle between food and forward direction see sources
         self.search_angle = params["search_angle"]
-        # foodscan duration
-        self.t_food_scan = params["t_food_scan"]
         # meters
         self.max_neighbour_awareness = params["max_neighbour_awareness"]
         # perception------------------------------------------------------------
@@ -75,7 +76,6 @@ class PredatorAgent(TypedAgent):
         # moving----------------------------------------------------------------
         # alignment zone
         self.alignment = params["alignment"]
-        self.angle_move = params["angle_move"]
         # individual reach
         self.reach = params["reach"]
         # higher than prey (see wolf paper)
@@ -86,19 +86,52 @@ class PredatorAgent(TypedAgent):
         self.search_duration = params["search_duration"]
         # moving----------------------------------------------------------------
 
-        # evolvable parameters--------------------------------------------------
-        self.r_repulsion = params["r_repulsion"]
-        self.r_attraction = params["r_attraction"]
-        self.angle_repulsion = params["angle_repulsion"]
-        self.angle_attraction = params["angle_attraction"]
-        # evolvable parameters--------------------------------------------------
-
         # predator specific parameters------------------------------------------
         self.attack_distance = attack_distance
         # print("-----------attack distance-------------", attack_distance)
         self.prey_detection_range = params["prey_detection_range"]
         self.attack_speed = params["attack_speed"]
         # predator specific parameters------------------------------------------
+        self.reset(unique_id, params)
+
+    def reset(self, unique_id, params):
+        """(Re)start as a newborn predator, also used to reuse a dead one from the model's pool.
+
+        Only the state and the mutable parameters (PREDATOR_GENOME) are set
+        here, the other parameters are the same for every predator of a model.
+        """
+        model = self.model
+        self.unique_id = unique_id
+        self.pos = None
+        self.params = dict(params)
+        self.attach(model.predator_store)
+        self.state = Predator_State.SEARCHING
+        self.t_current_activity = 0
+        # will be a prey object, target_id tells if it is still the same prey
+        # (a dead prey object can be reused for a newborn)
+        self.target = None
+        self.target_id = None
+        self.nearby_predators = []
+        self.nearby_prey = []
+        # set random initial direction
+        self.direction = np.array([model.random.random(), model.random.random()])
+        self.direction /= np.linalg.norm(self.direction)
+        # print("direction normalize self.direction: ", self.direction)
+
+        # internal state--------------------------------------------------------
+        self.position = params["position"]
+        self.energy = params["initial_energy"]
+        # internal state--------------------------------------------------------
+
+        # evolvable parameters--------------------------------------------------
+        # foodscan duration
+        self.t_food_scan = params["t_food_scan"]
+        self.angle_move = params["angle_move"]
+        self.r_repulsion = params["r_repulsion"]
+        self.r_attraction = params["r_attraction"]
+        self.angle_repulsion = params["angle_repulsion"]
+        self.angle_attraction = params["angle_attraction"]
+        # evolvable parameters--------------------------------------------------
 
     def step(self):
         # only die and reproduced if predator evolves
@@ -142,7 +175,7 @@ class PredatorAgent(TypedAgent):
 
     def chase(self):
         # print("predator chasing")
-        if self.target == None or not self.target.is_alive():
+        if self.target == None or not self.has_target() or not self.target.is_alive():
             self.set_state(Predator_State.SEARCHING)
             return
 
@@ -174,44 +207,45 @@ class PredatorAgent(TypedAgent):
         if self.t_current_activity >= self.t_food_scan:
             self.set_state(Predator_State.SEARCHING)
             return
-        agent = self.model.get_closest_agent_of_type_in_range(
-            pos=self.position,
-            type="prey",
-            range=self.prey_detection_range
-        )
+        agent = self.model.get_scan_result(self)
         if agent != None:
-            self.target = agent
+            self.set_target(agent)
             self.set_state(Predator_State.CHASING)
+            # a sleeping prey has to be awake to be chased
+            if self.model.scheduler == "wheel":
+                self.model.schedule.wake(agent)
 
     def eat(self):
-        self.energy += self.target.get_energy()
+        if not self.has_target():
+            # the prey died and its object was reused for a newborn
+            pass
+        elif self.model.synchronous:
+            # settled with the other claims on this prey at the end of the step
+            self.model.claim(self.model.kill_claims, self.target, self)
+        else:
+            self.consume(self.target)
+        self.set_target(None)
+        self.set_state(Predator_State.SEARCHING)
+
+    def consume(self, target):
+        self.energy += target.get_energy()
         if self.energy < self.max_energy:
             self.energy = self.max_energy
-        self.target.state = Prey_State.DEAD
-        if self.target.is_alive == True:
-            self.target.die()
-        self.target = None
-        self.set_state(Predator_State.SEARCHING)
+        target.state = Prey_State.DEAD
+        if target.is_alive == True:
+            target.die()
 
     def find_neighbors_in_range(self):
-        predators = self.model.get_predators()
-        if predators is None:
-            return []
-        predators_in_range = []
-        for agent in predators:
-            dist = np.linalg.norm(np.array(self.position)
-                                  -
-                                  np.array(agent.get_position())
-                                  )
-            if dist < self.max_neighbour_awareness:
-                predators_in_range.append(agent)
-        return predators_in_range
+        # includes the predator itself, group_move relies on that
+        return self.model.cached_neighbors_of_type(self, self.max_neighbour_awareness,
+                                                   "predator", include_center=True)
 
     # group move based on prey move
-    def group_move(self, neighbors):
+    def group_direction(self, neighbors):
         # get number of actual neighbors within zones
         d_hat = np.array([0, 0])
         current_position = np.array(self.position)
+        size = np.array([self.model.grid.width, self.model.grid.height])
         n_agents_rep = 0
         n_agents_attract = 0
         n_agents_align = 0
@@ -219,18 +253,17 @@ class PredatorAgent(TypedAgent):
         sum_1 = np.array([0.0, 0.0])
         sum_2 = np.array([0.0, 0.0])
         for agent in neighbors:
-            agent_pos = np.array(agent.get_position())
-            dist = np.linalg.norm(current_position -
-                                  agent_pos
-                                  )
+            # shortest way to the neighbour on the torus
+            offset = grouping.min_image(np.array(agent.get_position()) - current_position, size)
+            dist = np.linalg.norm(offset)
             if self.r_repulsion >= dist:
                 if dist != 0:
-                    sum_0 += (agent_pos - current_position) / dist
+                    sum_0 += offset / dist
                 n_agents_rep += 1
 
             if self.alignment >= dist:
                 if dist != 0:
-                    sum_1 += (agent_pos - current_position) / dist
+                    sum_1 += offset / dist
                 n_agents_align += 1
 
             if self.r_attraction >= dist:
@@ -249,59 +282,23 @@ class PredatorAgent(TypedAgent):
             d_hat = - sums / abs_sums
         else:
             d_hat = np.array([0, 0])
+        return d_hat
 
-        dot_product = (self.direction[0] * d_hat[0]) + \
-            (self.direction[1] * d_hat[1])
-        v_abs = np.sqrt(
-            (self.direction[0] * self.direction[0]) +
-            (self.direction[1] * self.direction[1])
-        )
-        d_abs = np.sqrt((d_hat[0] * d_hat[0]) + (d_hat[1] * d_hat[1]))
-        if v_abs == 0.0:
-            angle = round(random.uniform(0, math.pi), 2)
-        else:
-            x = round(dot_product / v_abs * d_abs, 2)
-            angle = math.acos(x)
-            if angle < 0:
-                angle = 360 - angle
-
-        if angle <= self.angle_repulsion or angle <= self.angle_attraction:
-            self.direction = d_hat
-        else:
-            vx = self.direction[0]
-            vy = self.direction[1]
-            
-            if random.random() < 0.5:
-                a = self.angle_repulsion
-            else:
-                a = self.angle_attraction
-            vx = vx * math.cos(a) - vy * math.sin(a)
-            vy = vx * math.cos(a) + vy * math.sin(a)
-            self.direction = np.array([vx, vy])
-        # random turn of a_M
-        if random.random() < 0.5:
-            t = - self.angle_move
-        else:
-            t = self.angle_move
-        vx = self.direction[0]
-        vy = self.direction[1]
-        vx = vx * math.cos(t) - vy * math.sin(t)
-        vy = vx * math.cos(t) + vy * math.sin(t)
-        self.direction = np.array([vx, vy])
-
-        # Get new position and make sure it is on the grid
-        if (self.direction[0] + self.direction[1] != 0.0):
-            new_position = self.max_speed * self.direction + current_position
-        else:
-            self.direction = np.array([random.random(), random.random()])
-            self.direction /= np.linalg.norm(self.direction)
-
-            new_position = self.max_speed * self.direction + current_position
-        new_position_rounded = new_position
-        # Set new pos
-        if (self.model.grid.out_of_bounds(new_position_rounded)):
-            new_position_rounded = self.model.grid.torus_adj(
-                new_position_rounded)
+    def group_move(self, neighbors):
+        move = self.model.take_move(self)
+        if move is None:
+            # same rules as grouping.batched_predator_moves, on a single row
+            d_hat = self.group_direction(neighbors)
+            draws = grouping.draw_turns(self.model.rng, 1, 5)
+            direction = grouping.turn(np.array([self.direction], dtype=float), np.array([d_hat], dtype=float),
+                                      self.angle_repulsion, self.angle_attraction, self.angle_move,
+                                      draws, in_degrees=False)
+            size = np.array([self.model.grid.width, self.model.grid.height])
+            direction, new_position = grouping.advance_predators(
+                np.array([self.position], dtype=float), direction, np.array([self.max_speed], dtype=float),
+                draws, size)
+            move = (direction[0], new_position[0])
+        self.direction, new_position_rounded = move
         self.move((new_position_rounded[0], new_position_rounded[1]))
 
     # Roaming in a group based on swarming
@@ -322,14 +319,14 @@ class PredatorAgent(TypedAgent):
 
     def random_move(self):
         # set random direction
-        self.direction = np.array([random.random(), random.random()])
+        self.direction = np.array([self.model.random.random(), self.model.random.random()])
         self.direction /= np.linalg.nrom(self.direction)
         new_position = np.array(self.pos) + (self.direction * self.max_speed)
         self.move((new_position[0], new_position[1]))
 
     def move(self, new_position):
-        self.model.grid.move_agent(self, new_position)
-        self.set_position(new_position)
+        self.model.move_agent(self, new_position)
+        self.set_position(self.pos)
 
     def attract_neighbors(self, neighbors):
         center = np.array([0.0, 0.0])
@@ -356,6 +353,10 @@ class PredatorAgent(TypedAgent):
 
     def set_target(self, target):
         self.target = target
+        self.target_id = None if target is None else target.unique_id
+
+    def has_target(self):
+        return self.target is not None and self.target.unique_id == self.target_id
 
     def set_state(self, state):
         self.state = state
@@ -372,8 +373,7 @@ class PredatorAgent(TypedAgent):
         if self.energy < self.reproduction_requirement:
             return False
         self.energy -= self.reproduction_cost
-        params = predator_params.mutate_params(deepcopy(self.params))
-        self.model.create_new_predator(params)
+        self.model.queue_birth("predator", dict(self.params), parent=self)
         return True
 
     def die(self):
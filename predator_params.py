@@ -1,6 +1,7 @@
+import numpy as np
 import setup
-import numpy.random as random
 from copy import deepcopy
+from agent_store import as_scalar
 
 SCALED_FLAG = False
 
@@ -33,27 +34,55 @@ default_params_predator = {
     "angle_move"    :   180 
 }
 # Also works with initialization if you pass default params
-def mutate_params(params):
-    if random.random() < 0.05:
-        params["t_food_scan"] = random.uniform(0.167, 1.99, 1)
-    if random.random() < 0.05:
-        params["r_repulsion"] = random.normal(params["r_repulsion"], 10, 1)
-    if random.random() < 0.05:
-        params["r_attraction"] = random.normal(params["r_attraction"], 10, 1)
+def mutate_params(params, rng):
+    if rng.random() < 0.05:
+        params["t_food_scan"] = rng.uniform(0.167, 1.99, 1)
+    if rng.random() < 0.05:
+        params["r_repulsion"] = rng.normal(params["r_repulsion"], 10, 1)
+    if rng.random() < 0.05:
+        params["r_attraction"] = rng.normal(params["r_attraction"], 10, 1)
         params["r_attraction"] = min(params["r_attraction"], params["r_repulsion"])
-    if random.random() < 0.05:
-        params["t_food_scan"] = random.uniform(0.167, 1.99, 1)
-    if random.random() < 0.05:
-        params["angle_repulsion"] = random.normal(params["angle_repulsion"], 72, 1)
-    if random.random() < 0.05:
-        params["angle_attraction"] = random.normal(params["angle_attraction"], 72, 1)
-    if random.random() < 0.05:
-        params["angle_move"] = random.normal(params["angle_move"], 72, 1)
+    if rng.random() < 0.05:
+        params["t_food_scan"] = rng.uniform(0.167, 1.99, 1)
+    if rng.random() < 0.05:
+        params["angle_repulsion"] = rng.normal(params["angle_repulsion"], 72, 1)
+    if rng.random() < 0.05:
+        params["angle_attraction"] = rng.normal(params["angle_attraction"], 72, 1)
+    if rng.random() < 0.05:
+        params["angle_move"] = rng.normal(params["angle_move"], 72, 1)
     
     
     return params
 
 
+def _mutate_uniform(params_list, rows, name, rng):
+    for i, value in zip(rows, rng.uniform(0.167, 1.99, len(rows))):
+        params_list[i][name] = np.array([value])
+
+
+def _mutate_normal(params_list, rows, name, sd, rng):
+    mean = np.array([as_scalar(params_list[i][name]) for i in rows])
+    for i, value in zip(rows, rng.normal(mean, sd)):
+        params_list[i][name] = np.array([value])
+
+
+def mutate_params_batch(params_list, rng):
+    """mutate_params for the parameters of many offspring, each rule drawn for all of them at once."""
+    hits = rng.random((len(params_list), 7)) < 0.05
+    rows = [np.flatnonzero(hits[:, rule]) for rule in range(7)]
+    _mutate_uniform(params_list, rows[0], "t_food_scan", rng)
+    _mutate_normal(params_list, rows[1], "r_repulsion", 10, rng)
+    _mutate_normal(params_list, rows[2], "r_attraction", 10, rng)
+    for i in rows[2]:
+        params = params_list[i]
+        params["r_attraction"] = min(params["r_attraction"], params["r_repulsion"])
+    _mutate_uniform(params_list, rows[3], "t_food_scan", rng)
+    _mutate_normal(params_list, rows[4], "angle_repulsion", 72, rng)
+    _mutate_normal(params_list, rows[5], "angle_attraction", 72, rng)
+    _mutate_normal(params_list, rows[6], "angle_move", 72, rng)
+    return params_list
+
+
 def get_default_params_predator():
     return deepcopy(default_params_predator)
 
@@ -2,15 +2,14 @@ import math
 import mesa
 from enum import Enum
 from TypedAgent import TypedAgent
+from agent_store import column_property, vector_property, state_property, genome_property
 
 import numpy as np
-import random
 from scipy import spatial
-import setup
 from scipy.stats import truncnorm
-from copy import deepcopy
 
 import prey_params
+import grouping
 
 
 class Prey_State(Enum):
@@ -23,80 +22,105 @@ class Prey_State(Enum):
     FLEEING = 8
     DEAD = 9
 
+# evolvable parameters kept in the genome columns of the prey AgentStore
+PREY_GENOME = ("pv", "pm", "pse", "psn", "pmtf", "tv", "av", "tp", "zr", "za",
+               "aa", "ar", "nr", "tm", "dm", "am", "df", "af", "tf")
+
 # Truncated normal distribution, takes range [lower, upper] and standard deviation (sd)
 
 
-def trunc_normal(lower, upper, sd, mu):
+def trunc_normal(lower, upper, sd, mu, random_state=None):
     mu = upper - lower
     r = truncnorm.rvs(
-        (lower - mu) / sd, (upper - mu) / sd, loc=mu, scale=sd, size=1)
+        (lower - mu) / sd, (upper - mu) / sd, loc=mu, scale=sd, size=1, random_state=random_state)
     return r
 
 
-def mutate(params):
-    for parameter in params:
-        if random.random() < 0.05:
-            if "zr" in parameter:
-                params[parameter] = trunc_normal(0, 50, 10, params[parameter])
-            elif "za" in parameter:
-                params[parameter] = trunc_normal(
-                    params["zr"], 50, 10, params[parameter])
-            elif "a" in parameter:
-                params[parameter] = trunc_normal(0, 360, 72, params[parameter])
-            elif "tp" in parameter:
-                pass
-            elif "tv" in parameter:
-                params[parameter] = trunc_normal(
-                    0.167, 1.99, 0.4, params[parameter])
-            elif "tm" in parameter:
-                params[parameter] = trunc_normal(
-                    0.167, 1.99, 0.4, params[parameter])
-            elif "p" in parameter:
-                params[parameter] = trunc_normal(0, 1, 0.2, params[parameter])
-            # elif "n" in parameter:
-            #     pass
-            elif "dm" in parameter:
-                params[parameter] = trunc_normal(0, 100, 3, params[parameter])
-            elif "pv" in parameter:
-                params[parameter] = trunc_normal(0, 1, 0.2, params[parameter])
-            elif "pm" in parameter:
-                params[parameter] = trunc_normal(0, 1, 0.2, params[parameter])
-            elif "pse" in parameter:
-                params[parameter] = trunc_normal(0, 1, 0.2, params[parameter])
-            elif "psn" in parameter:
-                params[parameter] = trunc_normal(0, 1, 0.2, params[parameter])
-            elif "pmtf" in parameter:
-                params[parameter] = trunc_normal(0, 1, 0.2, params[parameter])
-            elif "ar" in parameter:
-                params[parameter] = trunc_normal(0, 360, 72, params[parameter])
-            elif "aa" in parameter:
-                params[parameter] = trunc_normal(0, 360, 72, params[parameter])
-            elif "nr" in parameter:
-                params[parameter] = trunc_normal(0, 100, 1, params[parameter])
-        # return at the end modified params
-        return params
+def mutation_bounds(parameter, params):
+    # (lower, upper, sd) of the truncated normal a parameter mutates with,
+    # None for the parameters that do not mutate
+    if "zr" in parameter:
+        return 0, 50, 10
+    elif "za" in parameter:
+        return params["zr"], 50, 10
+    elif "a" in parameter:
+        return 0, 360, 72
+    elif "tp" in parameter:
+        return None
+    elif "tv" in parameter:
+        return 0.167, 1.99, 0.4
+    elif "tm" in parameter:
+        return 0.167, 1.99, 0.4
+    elif "p" in parameter:
+        return 0, 1, 0.2
+    # elif "n" in parameter:
+    #     pass
+    elif "dm" in parameter:
+        return 0, 100, 3
+    elif "nr" in parameter:
+        return 0, 100, 1
+    return None
+
+
+def mutate_batch(params_list, rng):
+    """Mutate the parameters of many offspring, with one draw per kind for all of them.
+
+    Each dict has a 5% chance to mutate, and then only in its first
+    parameter, drawn from the truncated normal of mutation_bounds.
+    """
+    hits = np.flatnonzero(rng.random(len(params_list)) < 0.05)
+    if len(hits) == 0:
+        return params_list
+    parameter = next(iter(params_list[0]))
+    hits = [i for i in hits if mutation_bounds(parameter, params_list[i]) is not None]
+    if not hits:
+        return params_list
+    lower, upper, sd = np.array([mutation_bounds(parameter, params_list[i]) for i in hits], dtype=float).T
+    # same distribution as trunc_normal, centred on upper - lower
+    mu = upper - lower
+    values = truncnorm.rvs((lower - mu) / sd, (upper - mu) / sd, loc=mu, scale=sd,
+                           size=len(hits), random_state=rng)
+    for i, value in zip(hits, values):
+        params_list[i][parameter] = np.array([value])
+    return params_list
 
 
 class PreyAgent(TypedAgent):
     """An agent that is a prey, as described in the paper."""
 
-    def __init__(self, unique_id, model, default_params=prey_params.default_params_prey, evolvable_params=prey_params.evolvable_params_prey):
+    # columns of model.prey_store, the agent itself only holds its row
+    position = vector_property("position")
+    v_hat = vector_property("heading")
+    energy = column_property("energy")
+    age = column_property("age")
+    state = state_property(Prey_State)
+    pv = genome_property("pv")
+    pm = genome_property("pm")
+    pse = genome_property("pse")
+    psn = genome_property("psn")
+    pmtf = genome_property("pmtf")
+    tv = genome_property("tv")
+    av = genome_property("av")
+    tp = genome_property("tp")
+    zr = genome_property("zr")
+    za = genome_property("za")
+    aa = genome_property("aa")
+    ar = genome_property("ar")
+    nr = genome_property("nr")
+    tm = genome_property("tm")
+    dm = genome_property("dm")
+    am = genome_property("am")
+    df = genome_property("df")
+    af = genome_property("af")
+    tf = genome_property("tf")
+
+    def __init__(self, unique_id, model, default_params=prey_params.default_params_prey, evolvable_params=None):
         super().__init__(unique_id, model)
         self.type = "prey"
-        self.state = Prey_State.NOTHING
-        self.previous_state = Prey_State.NOTHING
-        self.current_action_time_remaining = 0
-        self.detected_predator = False  # keep it like this or make it Boolean ?
-        self.max_age = default_params["max_age"] * setup.PROPORTION
-        self.age = self.max_age
-        self.energy = 100000 * setup.PROPORTION
+        self.max_age = default_params["max_age"] * model.proportion
 
         self.min_energy = 0
         self.default_params = default_params
-        self.evolvable_params = evolvable_params
-
-        self.position = default_params["position"]
-        self.food_target = default_params["food_target"]
 
         self.zl = default_params["zl"]
         self.dr = default_params["dr"]
@@ -104,18 +128,44 @@ class PreyAgent(TypedAgent):
         self.max_neighbour_awareness = default_params["max_neighbour_awareness"]
 
         self.h = default_params["h"] * \
-            setup.PROPORTION if default_params["h"] > 5 else 5
+            model.proportion if default_params["h"] > 5 else 5
         self.N = default_params["N"]
         self.em = default_params["em"]
-        self.max_energy = 100000 * setup.PROPORTION
+        self.max_energy = 100000 * model.proportion
         self.death_rate = default_params["death_rate"]
         self.mutation_rate = default_params["mutation_rate"]
-        self.is_safe = default_params["is_safe"]
-        self.waiting_time = default_params["waiting_time"]
         self.reaction_time = default_params["reaction_time"]
         self.er = default_params["er"]
         self.t_min = default_params["t_min"]
         self.te = default_params["te"]
+        self.reset(unique_id, evolvable_params)
+
+    def reset(self, unique_id, evolvable_params=None):
+        """(Re)start as a newborn prey, also used to reuse a dead one from the model's pool.
+
+        Only the state and the genome are set here, the rest of the
+        attributes are the same for every prey of a model.
+        """
+        model = self.model
+        default_params = self.default_params
+        self.unique_id = unique_id
+        self.pos = None
+        self.attach(model.prey_store)
+        self.state = Prey_State.NOTHING
+        self.previous_state = Prey_State.NOTHING
+        self.current_action_time_remaining = 0
+        self.detected_predator = False  # keep it like this or make it Boolean ?
+        self.age = self.max_age
+        self.energy = 100000 * model.proportion
+        # initial prey share the parameters the model sampled at the start
+        if evolvable_params is None:
+            evolvable_params = model.evolvable_params_prey
+        self.evolvable_params = evolvable_params
+
+        self.position = default_params["position"]
+        self.food_target = default_params["food_target"]
+        self.is_safe = default_params["is_safe"]
+        self.waiting_time = default_params["waiting_time"]
         self.nrz = default_params["nrz"]
         self.di = default_params["di"]
         self.v_hat = default_params["v_hat"]
@@ -140,9 +190,9 @@ class PreyAgent(TypedAgent):
         self.tp = evolvable_params["tp"]  # flee duration, minimum 0, sd = 5
         # grouping
         # repulsion zone, between 0 and 50, sd = 10
-        self.zr = evolvable_params["zr"] * setup.PROPORTION
+        self.zr = evolvable_params["zr"] * model.proportion
         # attraction zone, between zr and 50, sd = 10
-        self.za = evolvable_params["za"] * setup.PROPORTION
+        self.za = evolvable_params["za"] * model.proportion
         # maximum turning angle for attraction, between 0 and 360, sd = 72
         self.aa = evolvable_params["aa"]
         # maximum turning angle for repulsion, between 0 and 360, sd = 72
@@ -152,7 +202,7 @@ class PreyAgent(TypedAgent):
         # move duration, between 0.167 and 1.99, sd = 0.4
         self.tm = evolvable_params["tm"]
         # move distance, minimum 0, sd = 3
-        self.dm = evolvable_params["dm"] * setup.PROPORTION * 10
+        self.dm = evolvable_params["dm"] * model.proportion * 10
         # move angle, between 0 and 360, sd = 72
         self.am = evolvable_params["am"]
         # foraging
@@ -195,6 +245,7 @@ class PreyAgent(TypedAgent):
 
         if self.state == Prey_State.DEAD:
             self.die()
+            return
 
         # Waiting time (after fleeing from predator)
         if self.is_safe == True:
@@ -233,16 +284,17 @@ class PreyAgent(TypedAgent):
             if self.food_target == None:
                 self.new_move()
         elif self.state == Prey_State.MOVETOFOOD:  # braek out of movetofood if at food
-            if self.distance(self.food_target.position) <= self.dr:
+            if self.distance(self.model.food_layer.position(self.food_target)) <= self.dr:
                 self.state = Prey_State.EATING
                 self.current_action_time_remaining = self.te
             else:
                 self.move_to_food(self.food_target)
         elif self.state == Prey_State.EATING:
+            # another prey may have eaten the item first, that gains nothing
             if self.food_target != None:
-                self.energy += self.er
-                self.eat(self.food_target)
-                self.food_target = None
+                self.energy += self.eat(self.food_target)
+            self.food_target = None
+            self.doze()
         elif self.state == Prey_State.SCANNING:
             self.scan()
         elif self.state == Prey_State.FLEEING and (self.is_safe is False):
@@ -250,14 +302,14 @@ class PreyAgent(TypedAgent):
             self.new_move()
         # if current action complete or NONE, choose new action
         elif self.state == Prey_State.NOTHING:
-            RAND = np.random.rand()
+            RAND = self.model.rng.random()
 
             if RAND < self.pv:
                 self.state = Prey_State.SCANNING
             else:
                 if self.food_target is not None:
                    
-                    if self.distance(self.food_target.position) <= self.dr:
+                    if self.distance(self.model.food_layer.position(self.food_target)) <= self.dr:
                     
                         self.state = Prey_State.EATING
                         self.current_action_time_remaining = self.te
@@ -265,13 +317,13 @@ class PreyAgent(TypedAgent):
                         self.state = Prey_State.MOVETOFOOD
                 else:
                     if self.previous_state == Prey_State.MOVING:
-                        RAND = np.random.rand()
+                        RAND = self.model.rng.random()
                         if RAND < self.pm:
                             self.state = Prey_State.MOVING
                         else:
                             self.state = Prey_State.FOODSCAN
                     elif self.previous_state == Prey_State.EATING:
-                        RAND = np.random.rand()
+                        RAND = self.model.rng.random()
                         if RAND < self.pse:
                             self.state = Prey_State.FOODSCAN
                         else:
@@ -279,13 +331,13 @@ class PreyAgent(TypedAgent):
                     elif self.previous_state == Prey_State.FLEEING:
                         self.state = Prey_State.SCANNING
                     elif self.previous_state == Prey_State.SCANNING:
-                        RAND = np.random.rand()
+                        RAND = self.model.rng.random()
                         if RAND < self.pse:
                             self.state = Prey_State.FOODSCAN
                         else:
                             self.state = Prey_State.MOVING
                     elif self.previous_state == Prey_State.NOTHING:
-                        RAND = np.random.rand()
+                        RAND = self.model.rng.random()
                         if RAND < self.pse:
                             self.state = Prey_State.FOODSCAN
                         else:
@@ -328,38 +380,32 @@ class PreyAgent(TypedAgent):
 
         self.current_action_time_remaining = self.dm * self.tm
 
-    def new_move(self):
+    def group_direction(self):
         # Grouping params
         # get number of actual neighbors within zones
         d_hat = np.array([0, 0])
         count_neighbors = 0
         count_neighbours_repulsed = 0
         current_position = np.array([self.position[0], self.position[1]])
-        pos = (self.position[0], self.position[0])
         max_radius = max(self.zr, self.zl, self.za)
 
         zr_agents = []
         za_agents = []
         zl_agents = []
         nrz = 0
-  
-        for x in self.model.grid.get_neighbors(pos, radius=max_radius, include_center=False):
-            if x.type == "prey":
-                distance = self.distance(x.position)
-                if distance <= self.zr:
-                    count_neighbours_repulsed += 1
-                    zr_agents.append(x)
-            nrz = count_neighbours_repulsed  # actual neighbours in repulsion zone
-            if x.type == "prey":
-                distance = self.distance(x.position)
-                if distance <= self.zl:
-                    zl_agents.append(x)
-     
-            if x.type == "prey":
-                distance = self.distance(x.position)
-                if distance <= self.za:
-                    za_agents.append(x)
-            
+
+        for x in self.model.cached_neighbors_of_type(self, max_radius, "prey",
+                                                     max_radius=self.neighbour_radius()):
+            distance = self.distance(x.position)
+            if distance <= self.zr:
+                count_neighbours_repulsed += 1
+                zr_agents.append(x)
+            if distance <= self.zl:
+                zl_agents.append(x)
+            if distance <= self.za:
+                za_agents.append(x)
+        nrz = count_neighbours_repulsed  # actual neighbours in repulsion zone
+
         # Grouping
         if nrz >= self.nr:
             sum0 = np.array([0, 0])
@@ -399,73 +445,41 @@ class PreyAgent(TypedAgent):
             else:
                 d_hat = np.array([0, 0])
 
-        # calculate angle between v_hat and d_hat
-        dot_product = (self.v_hat[0] * d_hat[0]) + (self.v_hat[1] * d_hat[1])
-        v_abs = np.sqrt(
-            (self.v_hat[0] * self.v_hat[0]) + (self.v_hat[1] * self.v_hat[1]))
-        d_abs = np.sqrt((d_hat[0] * d_hat[0]) + (d_hat[1] * d_hat[1]))
-        if v_abs == 0.0:
-            angle = round(random.uniform(0, math.pi), 2)
-        else:
-            x = round(dot_product / v_abs * d_abs, 2)
-            angle = math.acos(x)
-            # convert to degrees, ensure positive
-            angle = abs(angle * (180.0 / math.pi))
+        return d_hat
 
-        if angle <= self.ar or angle <= self.aa:
-            self.v_hat = d_hat
-        else:
-            vx = self.v_hat[0]
-            vy = self.v_hat[1]
-            if random.random() < 0.5:
-                a = self.ar
-            else:
-                a = self.aa
-            vx = vx * math.cos(a) - vy * math.sin(a)
-            vy = vx * math.cos(a) + vy * math.sin(a)
-            self.v_hat = [vx, vy]
-
-        # random turn of a_M
-        if random.random() < 0.5:
-            t = - self.am
-        else:
-            t = self.am
-        vx = self.v_hat[0]
-        vy = self.v_hat[1]
-        vx = vx * math.cos(t) - vy * math.sin(t)
-        vy = vx * math.cos(t) + vy * math.sin(t)
-        self.v_hat = [vx, vy]
-
-        # Get new position and make sure it is on the grid
-        if (self.v_hat[0] + self.v_hat[1] != 0.0):
-            new_position = self.dm * self.v_hat + self.position
-        else:
-            self.v_hat = np.concatenate((self.pm, self.pm))
-            new_position = self.dm * self.v_hat + self.position
+    def new_move(self):
+        move = self.model.take_move(self)
+        if move is None:
+            # same rules as grouping.batched_prey_moves, on a single row
+            d_hat = self.group_direction()
+            v_hat = grouping.turn(np.array([self.v_hat], dtype=float), np.array([d_hat], dtype=float),
+                                  self.ar, self.aa, self.am, grouping.draw_turns(self.model.rng, 1))
+            size = np.array([self.model.grid.width, self.model.grid.height])
+            v_hat, new_position = grouping.advance(np.array([self.position], dtype=float), v_hat,
+                                                   np.array([self.dm]), np.array([self.pm]), size)
+            move = (v_hat[0], new_position[0])
+        self.v_hat, new_position_rounded = move
 
-        new_position_rounded = new_position
         # Set new pos
-        
-        if (self.model.grid.out_of_bounds(new_position_rounded)):
-            new_position_rounded = self.model.grid.torus_adj(
-                new_position_rounded)
-        self.model.grid.move_agent(self, new_position_rounded)
+        self.model.move_agent(self, new_position_rounded)
 
         self.position = (tuple(new_position_rounded))
         # Duration
         self.current_action_time_remaining = self.dm * self.tm
 
     def check_group(self):
-        pos = (self.position[0], self.position[0])
-        for neighbour in self.model.grid.get_neighbors(pos,  include_center=False,
-                                                       radius=self.max_neighbour_awareness):
-            if neighbour.get_type() == "prey":
-                self.nrz += 1
-                self.di = (self.di + neighbour.di) / 2
-                if neighbour.get_state() == Prey_State.FLEEING:
-                    self.state = Prey_State.FLEEING
-                    self.flee()
-                    self.new_move()
+        for neighbour in self.model.cached_neighbors_of_type(self, self.max_neighbour_awareness, "prey",
+                                                             max_radius=self.neighbour_radius()):
+            self.nrz += 1
+            self.di = (self.di + neighbour.di) / 2
+            if neighbour.get_state() == Prey_State.FLEEING:
+                self.state = Prey_State.FLEEING
+                self.flee()
+                self.new_move()
+
+    def neighbour_radius(self):
+        # largest radius the prey looks for other prey with (check_group, group_direction)
+        return max(self.max_neighbour_awareness, self.zr, self.zl, self.za)
 
     def distance(self, otherpos):
 
@@ -478,71 +492,83 @@ class PreyAgent(TypedAgent):
     def foodscan(self):
         
 
-        chosenitems = self.model.grid.get_neighbors(self.position, include_center=False,
-                                                    radius=self.max_neighbour_awareness)
-        chosenitem_ = None
-
-        for chosenitem in chosenitems:
-            if chosenitem.type == "food":
-                chosenitem_ = chosenitem
-                break
-
-
-        return chosenitem_
+        # index of the closest food item in range, None if there is none
+        return self.model.food_layer.nearest(self.pos, self.max_neighbour_awareness)
 
     def move_to_food(self, food_item):
-
+        food_position = self.model.food_layer.position(food_item)
         '''
         x = food_item.position[0] - self.dr * \
             abs(food_item.position[0] - self.position[0] / 2)
         y = food_item.position[1] - self.dr * \
             abs(food_item.position[1] - self.position[1] / 2)
         '''
-        x = food_item.position[0] - (self.dr/2) * \
-            abs(food_item.position[0] - self.position[0])
-        y = food_item.position[1] - (self.dr/2) * \
-            abs(food_item.position[1] - self.position[1])
+        x = food_position[0] - (self.dr/2) * \
+            abs(food_position[0] - self.position[0])
+        y = food_position[1] - (self.dr/2) * \
+            abs(food_position[1] - self.position[1])
         new_position = (x, y)
-        self.position = new_position
         self.current_action_time_remaining = self.distance(new_position)
+        # keep the spatial index in sync with where the prey actually is
+        self.model.move_agent(self, new_position)
+        self.position = self.pos
         
 
     def eat(self, food_item):
         
         # resource items that are eaten disappear immediately (no half eating possible)
-        self.model.remove_agents_food.append(food_item)
-        # remove the agent from the grid, immediately to prevent it being eaten twice
-        self.model.grid.remove_agent(food_item)
+        # returns the energy gained, the item's Er
+        return self.model.eat_food(self, food_item)
 
     def scan(self):
-        for neighbour in self.model.grid.get_neighbors(self.position, include_center=False,
-                                                       radius=self.max_neighbour_awareness):
-            if neighbour.get_type() == "predator":
-                predator_distance = self.distance(neighbour.position)
-                pd = pow(self.h, self.N) / ((pow(predator_distance, self.N)) * pow(self.h, self.N)) * (
-                    math.pi / self.av) * (self.tv / self.t_min)
-                if pd < random.random():
-                    self.detected_predator = neighbour
-                    break
+        for neighbour in self.model.cached_neighbors_of_type(self, self.max_neighbour_awareness, "predator"):
+            predator_distance = self.distance(neighbour.position)
+            pd = pow(self.h, self.N) / ((pow(predator_distance, self.N)) * pow(self.h, self.N)) * (
+                math.pi / self.av) * (self.tv / self.t_min)
+            if pd < self.model.random.random():
+                self.detected_predator = neighbour
+                break
 
         if self.detected_predator is None:
             self.current_action_time_remaining = self.tv
         else:
-            self.current_action_time_remaining = np.random.random() * self.tp + 1
+            self.current_action_time_remaining = self.model.rng.random() * self.tp + 1
 
     def flee(self):
         # No change in spatial position, safety is simply assumed
         self.is_safe = True
         self.detected_predator = None
         self.current_action_time_remaining = self.current_action_time_remaining - self.reaction_time
+        # sleeping neighbours would have noticed this in check_group
+        if self.model.scheduler == "wheel":
+            for neighbour in self.model.cached_neighbors_of_type(self, self.max_neighbour_awareness, "prey",
+                                                                 max_radius=self.neighbour_radius()):
+                self.model.schedule.wake(neighbour)
+
+    def doze(self):
+        # with the wheel scheduler, sleep through the rest of the eating:
+        # until then a step only counts down the action, age and energy
+        if self.model.scheduler != "wheel" or self.is_safe or self.detected_predator:
+            return
+        remaining = self.current_action_time_remaining
+        steps = int(math.floor(remaining)) + 1 if remaining >= 0 else 0
+        # wake up in time for the step that would starve it
+        if self.em > 0:
+            steps = min(steps, int(math.ceil((self.energy - self.min_energy) / self.em)) - 1)
+        self.model.schedule.sleep(self, steps)
+
+    def catch_up(self, steps):
+        super().catch_up(steps)
+        self.energy = self.energy - steps * self.em
+        self.current_action_time_remaining -= steps
 
     def reproduce(self):
         # Reproduction
        
         # energy changes due to birth
         self.energy = self.energy - (self.max_energy / 2)
-        child_params = mutate(deepcopy(self.evolvable_params))
-        self.model.create_new_prey(child_params)
+        # born (and mutated) with the others at the end of the step
+        self.model.queue_birth("prey", dict(self.evolvable_params), parent=self)
         
 
 
@@ -550,14 +576,12 @@ class PreyAgent(TypedAgent):
     def force_birth(self):
         n = 5
         summed_energy_neighbours = 0
-        for agent in self.model.grid.get_neighbors((int(setup.GRID_WIDTH/2), int(setup.GRID_HEIGHT/2)),
-                                                   include_center=True,
-                                                   radius=setup.GRID_WIDTH+1):
-            if agent.type == "prey":
-                summed_energy_neighbours += agent.energy
+        # the old query radius covered the whole torus, so this is every prey
+        for agent in self.model.get_prey():
+            summed_energy_neighbours += agent.energy
         summed_energy_neighbours = max(summed_energy_neighbours, 1)
         prob_to_birth = math.pow(self.energy / summed_energy_neighbours, n)
-        if np.random.random() > prob_to_birth:
+        if self.model.rng.random() > prob_to_birth:
             self.reproduce()
 
     def set_energy(self, new_energy):
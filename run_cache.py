@@ -0,0 +1,101 @@
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+import predator_params
+import prey_params
+
+# bump this whenever a change to the model would change the results of a
+# run, so results from older code are no longer picked up
+CODE_VERSION = "5"
+
+
+def params_digest(params):
+    """sha256 of one setup's model parameters, the same for equal dicts."""
+    blob = json.dumps(params, sort_keys=True, default=repr)
+    return hashlib.sha256(blob.encode()).hexdigest()
+
+
+class RunCache:
+    """On-disk cache of finished replicates, keyed by what determines them.
+
+    The key is a sha256 over the model parameters' digest, the prey and predator
+    default parameters, the number of steps, the seed and CODE_VERSION, so a
+    sweep only has to compute the (params, seed) pairs it has not seen yet.
+    Each replicate's global overview is one csv file named after its key.
+    With max_bytes set, the least recently used files are evicted once the
+    cache grows past it.
+    """
+
+    def __init__(self, directory="./results/cache", max_bytes=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, params, n_time_steps, seed):
+        content = {
+            "params": params_digest(params),
+            "prey": prey_params.default_params_prey,
+            "predator": predator_params.default_params_predator,
+            "n_time_steps": n_time_steps,
+            "seed": seed,
+            "code_version": CODE_VERSION
+        }
+        blob = json.dumps(content, sort_keys=True, default=repr)
+        return hashlib.sha256(blob.encode()).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ".csv")
+
+    def get(self, params, n_time_steps, seed):
+        """The cached global overview of this replicate, None if there is none."""
+        path = self.path(self.key(params, n_time_steps, seed))
+        if not os.path.exists(path):
+            return None
+        # the modification time doubles as last use for the eviction
+        os.utime(path)
+        # round_trip: the default parser can be 1 ulp off, cached runs must match fresh ones exactly
+        return pd.read_csv(path, float_precision="round_trip")
+
+    def put(self, params, n_time_steps, seed, df):
+        path = self.path(self.key(params, n_time_steps, seed))
+        # write next to it first so an interrupted run never leaves half a file
+        df.to_csv(path + ".tmp", index=False)
+        os.replace(path + ".tmp", path)
+        self.evict()
+
+    def invalidate(self, params, n_time_steps, seed):
+        """Drop one cached replicate, clear() drops everything."""
+        path = self.path(self.key(params, n_time_steps, seed))
+        if os.path.exists(path):
+            os.remove(path)
+
+    def clear(self):
+        for path, _, _ in self.entries():
+            os.remove(path)
+
+    def entries(self):
+        # (path, size, last use) of every cached replicate
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".csv"):
+                continue
+            stat = os.stat(os.path.join(self.directory, name))
+            entries.append((os.path.join(self.directory, name), stat.st_size, stat.st_mtime))
+        return entries
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        if self.max_bytes is None:
+            return
+        entries = sorted(self.entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
@@ -0,0 +1,142 @@
+from mesa.time import RandomActivation
+
+
+class TypedActivation(RandomActivation):
+    """RandomActivation that also keeps the agents grouped by type.
+
+    The per-type registry is updated on every add/remove, so the model can
+    read the prey and predators (and their counts) at any time without
+    walking the whole schedule. Passive types (the food) are registered
+    with add_passive: they count as agents but are never activated.
+    """
+
+    def __init__(self, model):
+        super().__init__(model)
+        # type -> {unique_id: agent}, in the order the agents were added
+        self.agents_by_type = {}
+        # type -> population with a len(), never stepped
+        self.passive = {}
+        # agent_store.ReadBuffer of a synchronous model, told who is stepping
+        self.buffer = None
+
+    def add(self, agent):
+        super().add(agent)
+        self.agents_by_type.setdefault(agent.type, {})[agent.unique_id] = agent
+
+    def add_agents(self, agents):
+        """add() for a batch of freshly created agents (unique ids from next_id)."""
+        for agent in agents:
+            self._agents[agent.unique_id] = agent
+            self.agents_by_type.setdefault(agent.type, {})[agent.unique_id] = agent
+
+    def remove(self, agent):
+        super().remove(agent)
+        del self.agents_by_type[agent.type][agent.unique_id]
+
+    def step(self):
+        if self.buffer is None:
+            super().step()
+            return
+        for agent in self.agent_buffer(shuffled=True):
+            self.buffer.actor = agent
+            agent.step()
+        self.buffer.actor = None
+        self.steps += 1
+        self.time += 1
+
+    def add_passive(self, type, population):
+        self.passive[type] = population
+
+    def get_type_count(self, type):
+        if type in self.passive:
+            return len(self.passive[type])
+        return len(self.agents_by_type.get(type, ()))
+
+    def get_agent_count(self):
+        """Active and passive agents, get_active_count() for the stepped ones."""
+        return len(self._agents) + sum(len(population) for population in self.passive.values())
+
+    def get_active_count(self):
+        return len(self._agents)
+
+    def type_counts(self):
+        counts = {type: len(agents) for type, agents in self.agents_by_type.items()}
+        counts.update((type, len(population)) for type, population in self.passive.items())
+        return counts
+
+    def agents_of_type(self, type):
+        """Live view of the scheduled agents of one type."""
+        return self.agents_by_type.setdefault(type, {}).values()
+
+
+class WheelActivation(TypedActivation):
+    """TypedActivation where agents can sleep through steps with nothing to do.
+
+    An agent in the middle of a long action calls sleep(agent, steps) and is
+    left out of the next ``steps`` activations, it is kept in a timer wheel
+    slot keyed by the step it wakes up on. wake(agent) interrupts the sleep,
+    the agent is activated again from the coming step. On its first
+    activation after sleeping the agent's catch_up(n) is called with the
+    number of steps it missed. Awake agents are activated in random order,
+    as in RandomActivation.
+    """
+
+    def __init__(self, model):
+        super().__init__(model)
+        # wake-up step -> {unique_id: agent}
+        self.wheel = {}
+        # unique_id -> wake-up step, for the agents asleep right now
+        self.sleeping = {}
+        # unique_id -> step the agent fell asleep in, until it is activated again
+        self.slept_since = {}
+        self.activations = 0
+        self.skipped = 0
+
+    def sleep(self, agent, steps):
+        if steps <= 0:
+            return
+        self.wake(agent)
+        wake_step = self.steps + steps + 1
+        self.wheel.setdefault(wake_step, {})[agent.unique_id] = agent
+        self.sleeping[agent.unique_id] = wake_step
+        self.slept_since.setdefault(agent.unique_id, self.steps)
+
+    def wake(self, agent):
+        wake_step = self.sleeping.pop(agent.unique_id, None)
+        if wake_step is not None:
+            del self.wheel[wake_step][agent.unique_id]
+
+    def is_asleep(self, agent):
+        return agent.unique_id in self.sleeping
+
+    def remove(self, agent):
+        self.wake(agent)
+        self.slept_since.pop(agent.unique_id, None)
+        super().remove(agent)
+
+    def step(self):
+        for unique_id in self.wheel.pop(self.steps, ()):
+            del self.sleeping[unique_id]
+        agent_keys = [key for key in self._agents if key not in self.sleeping]
+        self.model.random.shuffle(agent_keys)
+        self.skipped += len(self._agents) - len(agent_keys)
+        for key in agent_keys:
+            # agents can be removed (or put to sleep again) during the step
+            if key not in self._agents or key in self.sleeping:
+                continue
+            agent = self._agents[key]
+            if self.buffer is not None:
+                self.buffer.actor = agent
+            since = self.slept_since.pop(key, None)
+            if since is not None and self.steps - since > 1:
+                agent.catch_up(self.steps - since - 1)
+            agent.step()
+            self.activations += 1
+        if self.buffer is not None:
+            self.buffer.actor = None
+        self.steps += 1
+        self.time += 1
+
+    def stats(self):
+        return {"activations": self.activations, "skipped": self.skipped,
+                "sleeping": len(self.sleeping)}
@@ -12,4 +12,8 @@ GRID_HEIGHT = 150
 N_AGENTS = 30
 MAX_STEPS = 1000
 
-PROPORTION = GRID_WIDTH / 5660
\ No newline at end of file
+# the field of the paper, the default world is a scaled-down version of it
+FULL_SCALE_WIDTH = 5660
+FULL_SCALE_HEIGHT = 5660
+
+PROPORTION = GRID_WIDTH / FULL_SCALE_WIDTH
\ No newline at end of file
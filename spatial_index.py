@@ -0,0 +1,354 @@
+import math
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+def wrap(positions, size):
+    """Positions folded into [0, size), as cKDTree wants for periodic boxes."""
+    if size is None:
+        return positions
+    positions = np.mod(positions, size)
+    return np.where(positions >= size, 0.0, positions)
+
+
+class CellList:
+    """Uniform grid of buckets over a (toroidal) continuous space.
+
+    Items are hashed into square-ish cells of side ``cell_size``. A radius
+    query only visits the cells overlapping the query circle, so its cost
+    scales with the local density instead of the total number of items.
+    """
+
+    def __init__(self, width, height, cell_size, torus=True):
+        self.width = width
+        self.height = height
+        self.torus = torus
+        self.n_x = max(1, int(width // cell_size))
+        self.n_y = max(1, int(height // cell_size))
+        self.cell_width = width / self.n_x
+        self.cell_height = height / self.n_y
+        # only occupied cells are kept: (cx, cy) -> {item: (x, y)}
+        self.cells = {}
+        self.item_cell = {}
+
+    def __len__(self):
+        return len(self.item_cell)
+
+    def __contains__(self, item):
+        return item in self.item_cell
+
+    def cell_of(self, pos):
+        cx = int(pos[0] // self.cell_width) % self.n_x
+        cy = int(pos[1] // self.cell_height) % self.n_y
+        return cx, cy
+
+    def insert(self, item, pos):
+        pos = (float(pos[0]), float(pos[1]))
+        cell = self.cell_of(pos)
+        self.cells.setdefault(cell, {})[item] = pos
+        self.item_cell[item] = cell
+
+    def insert_many(self, items, positions):
+        """insert() for a whole (n, 2) array of positions at once."""
+        positions = np.asarray(positions, dtype=float).reshape(-1, 2)
+        cx = (positions[:, 0] // self.cell_width).astype(int) % self.n_x
+        cy = (positions[:, 1] // self.cell_height).astype(int) % self.n_y
+        for item, x, y, i, j in zip(items, positions[:, 0].tolist(), positions[:, 1].tolist(),
+                                    cx.tolist(), cy.tolist()):
+            self.cells.setdefault((i, j), {})[item] = (x, y)
+            self.item_cell[item] = (i, j)
+
+    def move(self, item, pos):
+        pos = (float(pos[0]), float(pos[1]))
+        old_cell = self.item_cell[item]
+        cell = self.cell_of(pos)
+        if cell == old_cell:
+            self.cells[cell][item] = pos
+            return
+        self._discard(item, old_cell)
+        self.cells.setdefault(cell, {})[item] = pos
+        self.item_cell[item] = cell
+
+    def remove(self, item):
+        self._discard(item, self.item_cell.pop(item))
+
+    def _discard(self, item, cell):
+        bucket = self.cells[cell]
+        del bucket[item]
+        if not bucket:
+            del self.cells[cell]
+
+    def position_of(self, item):
+        return self.cells[self.item_cell[item]][item]
+
+    def items(self):
+        for bucket in self.cells.values():
+            yield from bucket.items()
+
+    def _cell_range(self, centre, radius, cell_size, n):
+        lo = int(math.floor((centre - radius) / cell_size))
+        hi = int(math.floor((centre + radius) / cell_size))
+        if self.torus:
+            if hi - lo + 1 >= n:
+                return range(n)
+            return [c % n for c in range(lo, hi + 1)]
+        return range(max(lo, 0), min(hi, n - 1) + 1)
+
+    def query(self, pos, radius, include_center=False):
+        """Return ``(item, distance)`` pairs within ``radius`` of ``pos``."""
+        x, y = float(pos[0]), float(pos[1])
+        radius = float(radius)
+        r2 = radius * radius
+        xs = self._cell_range(x, radius, self.cell_width, self.n_x)
+        ys = self._cell_range(y, radius, self.cell_height, self.n_y)
+        found = []
+        for cx in xs:
+            for cy in ys:
+                bucket = self.cells.get((cx, cy))
+                if bucket is None:
+                    continue
+                for item, (ix, iy) in bucket.items():
+                    dx = abs(ix - x)
+                    dy = abs(iy - y)
+                    if self.torus:
+                        dx = min(dx, self.width - dx)
+                        dy = min(dy, self.height - dy)
+                    d2 = dx * dx + dy * dy
+                    if d2 <= r2 and (include_center or d2 > 0):
+                        found.append((item, math.sqrt(d2)))
+        return found
+
+
+class VerletLists:
+    """Verlet neighbour lists over the items of one CellList.
+
+    Every item keeps the candidates within ``cutoff + skin`` of it at the
+    last build. As long as two items have both moved at most ``skin / 2``
+    since then, they are in each other's candidates when within ``cutoff``,
+    so a query only filters the candidate list. Items that moved further, and
+    new items, are checked separately until the lists are rebuilt at the
+    start of the next step.
+    """
+
+    def __init__(self, cell_list, cutoff, skin):
+        self.cell_list = cell_list
+        self.cutoff = cutoff
+        self.skin = skin
+        self.candidates = {}
+        self.reference = {}
+        # items that moved more than skin / 2 since the last build, or are new
+        # (a dict, not a set, so they are visited in a reproducible order)
+        self.moved_out = {}
+        self.dirty = True
+        # statistics to tune the skin with
+        self.builds = 0
+        self.queries = 0
+        self.steps = 0
+
+    def build(self):
+        items = list(self.cell_list.items())
+        self.candidates = {item: [] for item, _ in items}
+        self.reference = dict(items)
+        if items:
+            size = None
+            if self.cell_list.torus:
+                size = np.array([self.cell_list.width, self.cell_list.height], dtype=float)
+            positions = wrap(np.array([pos for _, pos in items], dtype=float), size)
+            pairs = cKDTree(positions, boxsize=size).query_pairs(self.cutoff + self.skin, output_type="ndarray")
+            for i, j in pairs:
+                self.candidates[items[i][0]].append(items[j][0])
+                self.candidates[items[j][0]].append(items[i][0])
+        self.moved_out = {}
+        self.dirty = False
+        self.builds += 1
+
+    def _distance(self, a, b):
+        dx = abs(a[0] - b[0])
+        dy = abs(a[1] - b[1])
+        if self.cell_list.torus:
+            dx = min(dx, self.cell_list.width - dx)
+            dy = min(dy, self.cell_list.height - dy)
+        return math.sqrt(dx * dx + dy * dy)
+
+    def inserted(self, item):
+        self.moved_out[item] = None
+
+    def moved(self, item, pos):
+        reference = self.reference.get(item)
+        if reference is None or self._distance(reference, pos) > self.skin / 2:
+            self.moved_out[item] = None
+
+    def new_step(self):
+        self.steps += 1
+        if self.moved_out:
+            self.dirty = True
+
+    def query(self, item, radius, include_center=False):
+        """``(item, distance)`` pairs within radius of item, radius <= cutoff."""
+        if self.dirty:
+            self.build()
+        self.queries += 1
+        pos = self.cell_list.position_of(item)
+        if item in self.moved_out:
+            return self.cell_list.query(pos, radius, include_center)
+        found = [(item, 0.0)] if include_center else []
+        for other in self.candidates[item]:
+            # removed items stay in the lists until the next build, items
+            # that moved out are found through the cell list below
+            if other in self.moved_out or other not in self.cell_list:
+                continue
+            dist = self._distance(pos, self.cell_list.position_of(other))
+            if dist <= radius and (include_center or dist > 0):
+                found.append((other, dist))
+        # only the cells around pos, not every item that moved out this step
+        for other, dist in self.cell_list.query(pos, radius, include_center):
+            if other in self.moved_out:
+                found.append((other, dist))
+        return found
+
+    def stats(self):
+        return {"builds": self.builds, "queries": self.queries, "steps": self.steps,
+                "builds_per_step": self.builds / self.steps if self.steps else 0.0}
+
+
+def by_unique_id(found):
+    # the agents sum floats over their neighbours, a fixed order keeps the
+    # results the same whichever structure found the neighbours
+    return sorted(found, key=lambda pair: pair[0].unique_id)
+
+
+class SpatialIndex:
+    """One CellList per agent type, each with its own cell size.
+
+    use_verlet() switches same-type neighbour queries of a type over to
+    VerletLists, queries from other types keep using the cell list.
+    """
+
+    def __init__(self, width, height, cell_sizes, torus=True):
+        self.cell_lists = {}
+        self.verlet = {}
+        # bumped on every insert/remove, tells the NeighbourCache which
+        # populations changed since a query was cached
+        self.versions = {}
+        for type, cell_size in cell_sizes.items():
+            self.cell_lists[type] = CellList(width, height, cell_size, torus)
+            self.versions[type] = 0
+
+    def use_verlet(self, type, cutoff, skin):
+        self.verlet[type] = VerletLists(self.cell_lists[type], cutoff, skin)
+
+    def insert(self, agent, pos):
+        self.cell_lists[agent.type].insert(agent, pos)
+        self.versions[agent.type] += 1
+        if agent.type in self.verlet:
+            self.verlet[agent.type].inserted(agent)
+
+    def insert_many(self, agents, positions, type):
+        self.cell_lists[type].insert_many(agents, positions)
+        self.versions[type] += 1
+        if type in self.verlet:
+            for agent in agents:
+                self.verlet[type].inserted(agent)
+
+    def move(self, agent, pos):
+        self.cell_lists[agent.type].move(agent, pos)
+        if agent.type in self.verlet:
+            self.verlet[agent.type].moved(agent, self.cell_lists[agent.type].position_of(agent))
+
+    def remove(self, agent):
+        self.cell_lists[agent.type].remove(agent)
+        self.versions[agent.type] += 1
+
+    def count(self, type):
+        return len(self.cell_lists[type])
+
+    def query(self, pos, radius, type, include_center=False):
+        return by_unique_id(self.cell_lists[type].query(pos, radius, include_center))
+
+    def neighbours(self, agent, radius, type, include_center=False):
+        """Like query around the agent's own position, using the Verlet lists when it can."""
+        verlet = self.verlet.get(type)
+        if verlet is not None and agent.type == type and radius <= verlet.cutoff:
+            return by_unique_id(verlet.query(agent, radius, include_center))
+        return self.query(agent.pos, radius, type, include_center)
+
+    def new_step(self):
+        for verlet in self.verlet.values():
+            verlet.new_step()
+
+    def snapshot(self, type):
+        return KDTreeSnapshot(self.cell_lists[type])
+
+
+class KDTreeSnapshot:
+    """Frozen KD-tree over the positions of one CellList.
+
+    Built once per step, it answers "closest item within r" in O(log n),
+    either for one position or for a whole batch of positions at once.
+    """
+
+    def __init__(self, cell_list):
+        items = list(cell_list.items())
+        self.items = [item for item, _ in items]
+        self.size = None
+        if cell_list.torus:
+            self.size = np.array([cell_list.width, cell_list.height], dtype=float)
+        self.tree = None
+        if items:
+            positions = wrap(np.array([pos for _, pos in items], dtype=float), self.size)
+            self.tree = cKDTree(positions, boxsize=self.size)
+
+    def closest(self, pos, radius):
+        return self.closest_many([pos], radius)[0]
+
+    def closest_many(self, positions, radius):
+        """Closest item within radius of every position (None if there is none)."""
+        n = len(positions)
+        if self.tree is None or n == 0:
+            return [None] * n
+        positions = wrap(np.asarray(positions, dtype=float).reshape(n, 2), self.size)
+        radius = np.broadcast_to(np.asarray(radius, dtype=float).reshape(-1), (n,))
+        dists, idxs = self.tree.query(positions, k=1,
+                                      distance_upper_bound=np.nextafter(radius.max(), np.inf))
+        return [self.items[i] if d <= r else None for d, i, r in zip(dists, idxs, radius)]
+
+
+class NeighbourCache:
+    """Per-step memo of the neighbour queries of each agent.
+
+    The first query of an agent for a type is run once with the largest
+    radius the agent will ask for (``max_radius``), smaller-radius queries
+    from the same centre are then answered by filtering the cached
+    distances. An entry is only reused while the agent has not moved and no
+    agent of that type was added or removed, new_step() drops everything.
+    """
+
+    def __init__(self, spatial_index):
+        self.spatial_index = spatial_index
+        # (agent, type) -> (centre, radius, version, [(item, distance)])
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def new_step(self):
+        self.entries.clear()
+
+    def query(self, agent, pos, radius, type, include_center=False, max_radius=None):
+        centre = (float(pos[0]), float(pos[1]))
+        version = self.spatial_index.versions[type]
+        entry = self.entries.get((agent, type))
+        if entry is not None and entry[0] == centre and entry[1] >= radius and entry[2] == version:
+            self.hits += 1
+            found = entry[3]
+        else:
+            self.misses += 1
+            query_radius = radius if max_radius is None else max(radius, max_radius)
+            found = self.spatial_index.neighbours(agent, query_radius, type, include_center=True)
+            self.entries[(agent, type)] = (centre, query_radius, version, found)
+        return [(item, dist) for item, dist in found
+                if dist <= radius and (include_center or dist > 0)]
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0}